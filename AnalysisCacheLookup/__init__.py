@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import logging
+
+from utils.resultcache import (
+    ANALYSIS_CACHE_ENABLED,
+    CACHED_FIELDS,
+    copy_result_blobs,
+    evict_result,
+    find_cached_result,
+)
+from utils.swotutils import AnalysisMethod, AnalysisUtils
+
+
+def main(msg: dict) -> dict | None:
+    analysis_hash = msg.get("ANALYSIS_HASH")
+    if not ANALYSIS_CACHE_ENABLED or not analysis_hash:
+        return None
+
+    controller = AnalysisUtils(
+        msg["AZURE_STORAGE_KEY"],
+        msg["MONGODB_CONNECTION_STRING"],
+        msg["DATASET_ID"],
+        msg["SENDGRID_ANALYSIS_COMPLETION_TEMPLATE_ID"],
+        msg["SENDGRID_API_KEY"],
+        msg["WEBURL"],
+        msg["DEST_CONTAINER_NAME"],
+        msg["SRC_CONTAINER_NAME"],
+        msg["BLOB_NAME"],
+        msg["MAX_DURATION"],
+        msg["CONFIDENCE_LEVEL"],
+        msg["RG_NAME"],
+        msg["ERROR_RECEPIENT_EMAIL"],
+    )
+
+    try:
+        cached = find_cached_result(controller.db, analysis_hash)
+        if not cached or not cached.get("caseRisks"):
+            return None
+
+        src_dataset_id = cached["datasetId"]
+        if not copy_result_blobs(
+            controller.blob_result_cc, src_dataset_id, controller.dataset_id
+        ):
+            evict_result(controller.db, analysis_hash)
+            return None
+        fields = cached["fields"]
+    except Exception as ex:
+        # the cache only saves work, so a failed lookup runs the analysis
+        logging.warning("analysis cache lookup failed: %s", ex)
+        return None
+
+    logging.info(
+        "Reusing results of dataset %s for dataset %s",
+        src_dataset_id,
+        controller.dataset_id,
+    )
+    controller.update_dataset(
+        {key: fields[key] for key in CACHED_FIELDS if key in fields}
+    )
+    message = f"Reused the results of dataset {src_dataset_id}"
+    for analysis_method in AnalysisMethod:
+        controller.update_status(analysis_method, True, message)
+
+    return {"case_risks": cached["caseRisks"]}
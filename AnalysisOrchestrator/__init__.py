@@ -5,14 +5,24 @@ def orchestrator_function(context: df.DurableOrchestrationContext):
     msg = context.get_input()
     analysis_parameters = yield context.call_activity("AnalysisPrep", msg)
 
-    analysis_tasks = [
-        context.call_activity("AnnTrigger", analysis_parameters),
-        context.call_activity("EoTrigger", analysis_parameters),
-    ]
+    cached_result = yield context.call_activity(
+        "AnalysisCacheLookup", analysis_parameters
+    )
+    if cached_result:
+        # identical input and parameters were analysed before
+        ann_result = cached_result
+    else:
+        analysis_tasks = [
+            context.call_activity("AnnTrigger", analysis_parameters),
+            context.call_activity("EoTrigger", analysis_parameters),
+        ]
+        (ann_result, _) = yield context.task_all(analysis_tasks)
 
-    yield context.task_all(analysis_tasks)
-
-    yield context.call_activity("AnalysisPostprocess", analysis_parameters)
+    postprocess_parameters = {
+        **analysis_parameters,
+        "ANN_CASE_RISKS": (ann_result or {}).get("case_risks"),
+    }
+    yield context.call_activity("AnalysisPostprocess", postprocess_parameters)
     return "Done both functions!"
 
 
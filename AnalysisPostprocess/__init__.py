@@ -1,3 +1,6 @@
+import logging
+
+from ..utils.resultcache import ANALYSIS_CACHE_ENABLED, store_result
 from ..utils.swotutils import AnalysisUtils
 
 
@@ -17,6 +20,17 @@ def main(msg: dict) -> str:
         msg["RG_NAME"],
         msg["ERROR_RECEPIENT_EMAIL"],
     )
-    controller.postprocess()
+    case_risks = controller.postprocess(msg.get("ANN_CASE_RISKS"))
+    if ANALYSIS_CACHE_ENABLED and case_risks and msg.get("ANALYSIS_HASH"):
+        try:
+            store_result(
+                controller.db,
+                msg["ANALYSIS_HASH"],
+                controller.get_dataset(),
+                case_risks,
+            )
+        except Exception as ex:
+            # the analysis succeeded; it is only not reusable
+            logging.warning("failed to cache the analysis result: %s", ex)
 
     return "Done postprocessing"
@@ -2,16 +2,21 @@ from __future__ import annotations
 
 import logging
 import os
-from functools import partial
-from typing import Any, Dict
 
 import azure.durable_functions as df
-import azure.functions as func
 
 # import certifi
 from bson import ObjectId
-from pymongo import MongoClient
-from utils.standardize import Datapoint
+from utils.batch import DatapointBatch
+from utils.clients import get_blob_service_client, get_mongo_client
+from utils.indexes import (
+    DATAPOINT_PROJECTION,
+    ensure_all_indexes,
+    get_datapoint_filter,
+)
+from utils.ingestion import DATAPOINT_INGEST_MODE
+from utils.resultcache import get_analysis_hash
+from utils.streaming import BlockBlobWriter
 
 PAPERTRAIL_ADDRESS = os.getenv("PAPERTRAIL_ADDRESS")
 PAPERTRAIL_PORT = int(os.getenv("PAPERTRAIL_PORT", "0"))
@@ -32,39 +37,47 @@ if not WEBURL.startswith("http"):
     WEBURL = f"https://{WEBURL}"
 
 
-def datapoint_eq(datapoint1, datapoint2):
-    return (
-        datapoint1["tsDate"] == datapoint2["tsDate"]
-        and datapoint1["hhDate"] == datapoint2["hhDate"]
-    )
-
-
-def remove_duplicates(datapoints: list[dict]) -> list[Datapoint]:
+def resolve_duplicates(datapoints: list[dict]) -> list[dict]:
+    """Replaces each datapoint document by the document that wins its
+    (tsDate, hhDate) key, keeping one entry per input document."""
+    # first pass: for every (tsDate, hhDate) key, remember the last document seen
+    # and the earliest-seen overwriting document with the newest upload date
+    groups: dict[tuple, list] = {}
+    for datapoint in datapoints:
+        key = (datapoint["tsDate"], datapoint["hhDate"])
+        group = groups.setdefault(key, [None, None])
+        group[0] = datapoint
+        newest = group[1]
+        if datapoint["overwriting"] and (
+            newest is None or datapoint["dateUploaded"] > newest["dateUploaded"]
+        ):
+            group[1] = datapoint
+
+    # second pass: resolve each document against its group, preserving input order
     resolved_datapoints = []
     for datapoint in datapoints:
-        latest = datapoint
-        duplicates = filter(partial(datapoint_eq, datapoint2=datapoint), datapoints)
-        for d in duplicates:
-            if (
-                d["dateUploaded"] > latest["dateUploaded"]
-                and d["overwriting"]
-                or not datapoint["overwriting"]
-            ):
-                latest = d
-        resolved_datapoints.append(Datapoint.from_document(latest))
+        (last, newest) = groups[(datapoint["tsDate"], datapoint["hhDate"])]
+        if not datapoint["overwriting"]:
+            latest = last
+        elif newest["dateUploaded"] > datapoint["dateUploaded"]:
+            latest = newest
+        else:
+            latest = datapoint
+        resolved_datapoints.append(latest)
 
     return resolved_datapoints
 
 
-def main(msg: dict, output: func.Out[str]) -> None:
+def main(msg: dict) -> dict:
     # ca = certifi.where()
     dataset_id = msg["datasetId"]
     logging.info(
         "In AnalysisPrep: %s",
         msg,
     )
-    mongo_client: MongoClient[Dict[str, Any]] = MongoClient(MONGODB_CONNECTION_STRING)
+    mongo_client = get_mongo_client(MONGODB_CONNECTION_STRING)
     db = mongo_client.get_database()
+    ensure_all_indexes(db)
     dataset_collection = db.get_collection("datasets")
     datapoint_collection = db.get_collection("datapoints")
     # update status to inprogress and reset ann and eo status
@@ -76,22 +89,19 @@ def main(msg: dict, output: func.Out[str]) -> None:
     assert isinstance(dataset, dict)
     (start_date, end_date) = (dataset["startDate"], dataset["endDate"])
 
-    date_filter = {"$lt": end_date}
-    if start_date:
-        date_filter["$gt"] = start_date
-
     datapoint_documents = list(
         datapoint_collection.find(
-            {
-                "tsDate": date_filter,
-                "overwriting": {"$ne": None},
-                "dateUploaded": {"$ne": None},
-                "fieldsite": dataset["fieldsite"],
-            }
+            get_datapoint_filter(dataset["fieldsite"], start_date, end_date),
+            DATAPOINT_PROJECTION,
         ).sort("tsDate", 1)
     )
 
-    resolved_datapoints = remove_duplicates(datapoint_documents)
+    if DATAPOINT_INGEST_MODE != "upsert":
+        # upsert mode stores one datapoint per key, so the read is the input;
+        # see DATAPOINT_INGEST_MODE for how the two modes' inputs differ
+        datapoint_documents = resolve_duplicates(datapoint_documents)
+    resolved_datapoints = DatapointBatch.from_documents(datapoint_documents)
+    del datapoint_documents
     dataset_collection.update_one(
         {"_id": ObjectId(dataset_id)},
         {
@@ -102,10 +112,7 @@ def main(msg: dict, output: func.Out[str]) -> None:
             }
         },
     )
-    Datapoint.add_timezones(resolved_datapoints)
-    lines = Datapoint.get_csv_lines(resolved_datapoints)
-
-    output.set("\n".join(lines))
+    resolved_datapoints.add_timezones()
 
     analysis_parameters = {
         "AZURE_STORAGE_KEY": AZURE_STORAGE_KEY,
@@ -129,4 +136,14 @@ def main(msg: dict, output: func.Out[str]) -> None:
         ),
     }
 
+    # the analysis input is serialized and uploaded block by block
+    blob_client = get_blob_service_client(AZURE_STORAGE_KEY).get_blob_client(
+        ANALYSIS_CONTAINER_NAME, analysis_parameters["BLOB_NAME"]
+    )
+    with BlockBlobWriter(blob_client) as csv_writer:
+        lines = csv_writer.write_lines(resolved_datapoints.iter_csv_lines())
+        analysis_parameters["ANALYSIS_HASH"] = get_analysis_hash(
+            lines, analysis_parameters
+        )
+
     return analysis_parameters
@@ -1,12 +1,12 @@
 import logging
 import os
-import tempfile
 import traceback
 
 import matplotlib as mpl
 from matplotlib import pyplot as plt
 from swotann.nnetwork import NNetwork
 from utils import swotutils
+from utils.postprocessing import CASES, read_case_risks
 from utils.standalone_html import make_html_images_inline
 from utils.swotutils import AnalysisMethod, AnalysisUtils
 
@@ -16,7 +16,7 @@ plt.ioff()
 ANALYSIS_METHOD = swotutils.AnalysisMethod.ANN
 
 
-def main(msg: dict) -> None:
+def main(msg: dict) -> dict:
     network_count = msg.get("NETWORK_COUNT")
     epochs = msg.get("EPOCHS")
 
@@ -43,8 +43,9 @@ def main(msg: dict) -> None:
 
     success = True
     message = "OK"
+    case_risks = None
     try:
-        process_queue(controller, network_count, epochs)
+        case_risks = process_queue(controller, network_count, epochs)
     except Exception as ex:
         message = "".join(traceback.format_exception(ex))
         success = False
@@ -54,16 +55,18 @@ def main(msg: dict) -> None:
     finally:
         controller.update_status(ANALYSIS_METHOD, success, message)
 
-    return "Done ANN"
+    # handed to postprocessing so it does not have to download the case files
+    return {"case_risks": case_risks}
 
 
-def process_queue(controller: AnalysisUtils, network_count: int, epochs: int):
+def process_queue(
+    controller: AnalysisUtils, network_count: int, epochs: int
+) -> dict[str, list[float]]:
     dataset_id = controller.dataset_id
-    input_filepath = controller.download_src_blob()
     base_output_filename = f"{dataset_id}.csv"
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # tmpdir = tempfile.mkdtemp()
+    with controller.scratch_directory(ANALYSIS_METHOD.value) as tmpdir:
+        input_filepath = controller.download_src_blob(tmpdir)
         output_dirname = os.path.join(tmpdir, dataset_id)
         os.makedirs(output_dirname)
 
@@ -88,6 +91,10 @@ def process_queue(controller: AnalysisUtils, network_count: int, epochs: int):
             True,
         )
         controller.update_dataset({"ann": metadata})
+        case_filepaths = [
+            os.path.join(output_dirname, f"{dataset_id}_{case}.csv") for case in CASES
+        ]
+        case_risks = dict(zip(CASES, read_case_risks(case_filepaths)))
 
         # make report file standalone (convert all images to base64)
         report_file_standalone = report_filepath.replace(".html", "-standalone.html")
@@ -99,3 +106,5 @@ def process_queue(controller: AnalysisUtils, network_count: int, epochs: int):
 
         directory_name = dataset_id
         controller.upload_files(directory_name, output_files)
+
+    return case_risks
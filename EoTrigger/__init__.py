@@ -1,6 +1,5 @@
 import logging
 import os
-import tempfile
 import traceback
 
 import matplotlib as mpl
@@ -58,25 +57,28 @@ def main(msg: dict) -> None:
 def process_queue(controller: AnalysisUtils):
     dataset_id = controller.dataset_id
 
-    input_filepath = controller.download_src_blob()
+    with controller.scratch_directory(ANALYSIS_METHOD.value) as workdir:
+        input_filepath = controller.download_src_blob(workdir)
 
-    tmpdir = tempfile.mkdtemp()
+        output_dirname = os.path.join(workdir, "output")
+        os.makedirs(output_dirname)
 
-    eo = EO_Ensemble(
-        controller.max_duration,
-        tmpdir,
-        input_filepath,
-        controller.confidence_level,
-    )
+        eo = EO_Ensemble(
+            controller.max_duration,
+            output_dirname,
+            input_filepath,
+            controller.confidence_level,
+        )
 
-    # results filename will be the same as the input filename, but that's OK because they'll live in different directories
-    metadata = eo.run_EO()
-    frc = metadata["frc"]
-    controller.update_dataset({"eo": {"reco": frc}})
+        # results filename will be the same as the input filename, but that's OK because they'll live in different directories
+        metadata = eo.run_EO()
+        frc = metadata["frc"]
+        controller.update_dataset({"eo": {"reco": frc}})
 
-    output_files = [
-        os.path.realpath(os.path.join(tmpdir, file)) for file in os.listdir(tmpdir)
-    ]
+        output_files = [
+            os.path.realpath(os.path.join(output_dirname, file))
+            for file in os.listdir(output_dirname)
+        ]
 
-    directory_name = os.path.join(dataset_id, "eo")
-    controller.upload_files(directory_name, output_files)
+        directory_name = os.path.join(dataset_id, "eo")
+        controller.upload_files(directory_name, output_files)
@@ -1,25 +1,51 @@
 from __future__ import annotations
 
-import csv
 import logging
+import multiprocessing
 import os
 import tempfile
-from typing import Any, Dict
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator
 from uuid import uuid4
 
 import azure.functions as func
 
 # import certifi
-import openpyxl
 from azure.storage.blob import BlobClient, ContainerClient
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from pymongo.collection import Collection
+from utils.batch import DatapointBatch
+from utils.clients import get_blob_service_client, get_mongo_client
+from utils.columnar import extract_columnar
+from utils.indexes import ensure_all_indexes
+from utils.ingestion import DatapointWriter
 from utils.mailing import send_mail
-from utils.standardize import UploadedFileSummary, extract
+from utils.standardize import (
+    RowSource,
+    UploadedFileSummary,
+    extract,
+    iter_row_chunks,
+)
+from utils.streaming import iter_blob_lines
 from utils.swotutils import get_locations_from_fieldsite_id
+from utils.xlsx import StreamingXLSXRowSource, XLSXRowSource
 
 PAPERTRAIL_ADDRESS = os.getenv("PAPERTRAIL_ADDRESS")
 PAPERTRAIL_PORT = int(os.getenv("PAPERTRAIL_PORT", "0"))
+# "columnar" parses and validates a chunk column by column, "rows" row by row
+EXTRACT_ENGINE = os.getenv("EXTRACT_ENGINE", "rows")
+# files are extracted and written this many rows at a time
+EXTRACT_CHUNK_ROWS = int(os.getenv("EXTRACT_CHUNK_ROWS", "10000"))
+# threads download, parse and write the files of one upload concurrently
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+# when set, parsing is moved off the threads into this many processes
+UPLOAD_PARSE_PROCESSES = int(os.getenv("UPLOAD_PARSE_PROCESSES", "0"))
+XLSX_SPOOL_SIZE = int(os.getenv("XLSX_SPOOL_SIZE", str(64 * 1024 * 1024)))
+# "openpyxl" reads workbooks with openpyxl, "stream" parses the sheet xml directly
+XLSX_ENGINE = os.getenv("XLSX_ENGINE", "openpyxl")
 
 
 class ModelNotFound(Exception):
@@ -28,30 +54,145 @@ class ModelNotFound(Exception):
         super().__init__(message)
 
 
+class ParsePool:
+    """Parser processes shared by the invocations of a worker.
+
+    The processes are started from a fork server rather than forked from the
+    invocation's threads, which could fork while another thread holds a lock
+    (logging, the storage SDK) and leave the child deadlocked.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor: ProcessPoolExecutor | None = None
+        self.lock = threading.Lock()
+
+    def get(self) -> ProcessPoolExecutor | None:
+        if self.max_workers <= 0:
+            return None
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                )
+            return self.executor
+
+    def discard(self, executor: ProcessPoolExecutor):
+        """Drops a broken executor, so that the next upload starts a new one."""
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False)
+
+
+parse_pool = ParsePool(UPLOAD_PARSE_PROCESSES)
+
+
 def generate_random_filename(extension="csv"):
     return str(uuid4()) + f".{extension}"
 
 
-def convert_xlsx_blob_to_csv(
-    blob_client: BlobClient, fp: tempfile._TemporaryFileWrapper
-):
-    xlsx_fp = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
-    xlsx_fp.write(blob_client.download_blob().readall())
-    xlsx_fp.close()
+def extract_source(source: RowSource | Iterable[str]) -> tuple[DatapointBatch, list]:
+    if EXTRACT_ENGINE == "columnar":
+        return extract_columnar(source)
+    (datapoints, errors) = extract(source)
+    return DatapointBatch.from_datapoints(datapoints), errors
+
+
+def iter_extracted_chunks(
+    source: RowSource | Iterable[str],
+) -> Iterator[tuple[DatapointBatch, list]]:
+    for chunk in iter_row_chunks(source, EXTRACT_CHUNK_ROWS):
+        yield extract_source(chunk)
 
-    wb = openpyxl.load_workbook(xlsx_fp.name, read_only=True, data_only=True)
-    sh = wb.active
-    wr = csv.writer(fp, quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
 
-    for row in sh.rows:
-        rowvalues = []
-        for cell in row:
-            rowvalues.append(cell.value)
-        wr.writerow(rowvalues)
+def iter_blob_chunks(
+    blob_client: BlobClient, ext: str
+) -> Iterator[tuple[DatapointBatch, list]]:
+    if ext == "xlsx":
+        # workbooks need random access, so buffer the blob (in memory while small)
+        with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE) as fp:
+            blob_client.download_blob().readinto(fp)
+            fp.seek(0)
+            if XLSX_ENGINE == "stream":
+                source = StreamingXLSXRowSource(fp)
+            else:
+                source = XLSXRowSource(fp)
+            try:
+                yield from iter_extracted_chunks(source)
+            finally:
+                source.close()
+    elif ext == "csv":
+        # decode the download stream chunk by chunk instead of buffering the blob
+        yield from iter_extracted_chunks(iter_blob_lines(blob_client))
+    else:
+        raise TypeError(f"Invalid file extension {ext}")
 
-    fp.flush()
-    wb.close()
-    os.remove(xlsx_fp.name)
+
+def concat_chunks(
+    chunks: Iterable[tuple[DatapointBatch, list]]
+) -> tuple[DatapointBatch, list]:
+    batches: list[DatapointBatch] = []
+    errors: list = []
+    for (datapoints, chunk_errors) in chunks:
+        batches.append(datapoints)
+        errors.extend(chunk_errors)
+    return DatapointBatch.concat(batches), errors
+
+
+def extract_blob_by_name(
+    connection_string: str, container_name: str, blob_name: str, ext: str
+) -> tuple[DatapointBatch, list]:
+    # runs in a parser process, so the storage client is created here
+    blob_client = get_blob_service_client(connection_string).get_blob_client(
+        container_name, blob_name
+    )
+    return concat_chunks(iter_blob_chunks(blob_client, ext))
+
+
+def ingest_blob(
+    connection_string: str,
+    container_name: str,
+    blob_name: str,
+    datapoint_collection: Collection[Dict[str, Any]],
+    document_fields: dict,
+) -> tuple[UploadedFileSummary, DatapointWriter]:
+    # stream file contents
+    # standardize it chunk by chunk, writing each chunk as it is parsed
+    # add overwriting flag
+    # handle blob by extension
+    ext = blob_name.split(".")[-1]
+    args = (connection_string, container_name, blob_name, ext)
+    executor = parse_pool.get()
+    if executor:
+        # the parser process returns the whole file, packed as one batch
+        try:
+            chunks: Iterable[tuple[DatapointBatch, list]] = [
+                executor.submit(extract_blob_by_name, *args).result()
+            ]
+        except BrokenProcessPool:
+            parse_pool.discard(executor)
+            raise
+    else:
+        chunks = iter_blob_chunks(
+            get_blob_service_client(connection_string).get_blob_client(
+                container_name, blob_name
+            ),
+            ext,
+        )
+
+    errors_in_file: list = []
+    with DatapointWriter(datapoint_collection) as writer:
+        for (datapoints, errors) in chunks:
+            errors_in_file.extend(errors)
+            writer.write_many(
+                datapoints.to_documents(chunk_size=writer.batch_size, **document_fields)
+            )
+    filename_as_uploaded = "_".join(blob_name.split("_")[1:])
+    summary = UploadedFileSummary(filename_as_uploaded, errors_in_file)
+
+    return summary, writer
 
 
 def main(msg: func.QueueMessage) -> None:
@@ -68,8 +209,9 @@ def main(msg: func.QueueMessage) -> None:
     AZURE_STORAGE_CONNECTION_STRING = os.getenv("AzureWebJobsStorage", "")
     UPLOAD_COLLECTION_NAME = os.getenv("UPLOAD_COLLECTION_NAME", "")
 
-    mongo_client: MongoClient[Dict[str, Any]] = MongoClient(MONGODB_CONNECTION_STRING)
+    mongo_client = get_mongo_client(MONGODB_CONNECTION_STRING)
     db = mongo_client.get_database()
+    ensure_all_indexes(db)
     col = db.get_collection(UPLOAD_COLLECTION_NAME)
     upl = col.find_one({"_id": ObjectId(upload_id)})
     if not upl:
@@ -80,53 +222,45 @@ def main(msg: func.QueueMessage) -> None:
     is_overwriting = upl["overwriting"]
     in_container_name = upl["containerName"]
 
-    blob_cc: ContainerClient = ContainerClient.from_connection_string(
-        AZURE_STORAGE_CONNECTION_STRING, in_container_name
+    blob_cc: ContainerClient = get_blob_service_client(
+        AZURE_STORAGE_CONNECTION_STRING
+    ).get_container_client(in_container_name)
+
+    blob_names = [blob.name for blob in blob_cc.list_blobs(name_starts_with=upload_id)]
+    datapoint_collection = db.get_collection("datapoints")
+    document_fields = {
+        "upload": ObjectId(upload_id),
+        "fieldsite": fieldsite_id,
+        "dateUploaded": upl[
+            "dateUploaded"
+        ],  # can be referenced by aggregation, but doing this for simplicity
+        "overwriting": is_overwriting,  # can be referenced by aggregation, but doing this for simplicity
+    }
+
+    # files are downloaded, parsed and written concurrently; map keeps the
+    # results (and therefore the email summaries) in blob listing order
+    ingest = partial(
+        ingest_blob,
+        AZURE_STORAGE_CONNECTION_STRING,
+        in_container_name,
+        datapoint_collection=datapoint_collection,
+        document_fields=document_fields,
     )
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+        results = list(pool.map(ingest, blob_names))
 
-    blobs = blob_cc.list_blobs(name_starts_with=upload_id)
     uploaded_file_summaries: list[UploadedFileSummary] = []
-
-    for blob in blobs:
-        # generate temp file
-        # download file to it
-        # standardize it, returning list of DataPoint objects
-        # add overwriting flag
-        bc = blob_cc.get_blob_client(blob)
-        fp = tempfile.NamedTemporaryFile(
-            suffix=".csv", mode="w", newline="", delete=False
-        )
-        tmpname = fp.name
-        # handle blob by extension
-        ext = blob.name.split(".")[-1]
-        if ext == "xlsx":
-            # convert xlsx to csv and write to fp
-            convert_xlsx_blob_to_csv(bc, fp)
-        elif ext == "csv":
-            fp.write(bc.download_blob().content_as_text(encoding="utf-8-sig"))
-            fp.flush()
-        else:
-            raise TypeError(f"Invalid file extension {ext}")
-
-        fp.close()
-        datapoint_collection = db.get_collection("datapoints")
-        datapoints, errors_in_file = extract(tmpname)
-        filename_as_uploaded = "_".join(blob.name.split("_")[1:])
-        summary = UploadedFileSummary(filename_as_uploaded, errors_in_file)
+    for summary, writer in results:
         uploaded_file_summaries.append(summary)
-
-        for datapoint in datapoints:
-            datapoint_collection.insert_one(
-                datapoint.to_document(
-                    upload=ObjectId(upload_id),
-                    fieldsite=fieldsite_id,
-                    dateUploaded=upl[
-                        "dateUploaded"
-                    ],  # can be referenced by aggregation, but doing this for simplicity
-                    overwriting=is_overwriting,  # can be referenced by aggregation, but doing this for simplicity
-                )
+        if writer.failures:
+            logging.error(
+                "upload %s, file %s: %d of %d datapoint batches failed, %d datapoints written",
+                upload_id,
+                summary.filename,
+                len(writer.failures),
+                writer.n_batches,
+                writer.n_written,
             )
-        os.remove(tmpname)
 
     location_names = get_locations_from_fieldsite_id(fieldsite_id, db)
     country_name = location_names["country"]
@@ -0,0 +1,76 @@
+"""Memory of datapoints held as Datapoint objects and as a DatapointBatch.
+
+python -m benchmarks.bench_datapoint_batch [rows]
+"""
+from __future__ import annotations
+
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from utils.batch import DatapointBatch
+from utils.ingestion import DATAPOINT_BATCH_SIZE
+from utils.standardize import extract
+
+
+def make_lines(n_rows: int) -> list[str]:
+    lines = ["ts_datetime,hh_datetime,ts_frc,hh_frc,ts_wattemp,ts_cond"]
+    start = datetime(2022, 1, 1)
+    for i in range(n_rows):
+        ts_date = start + timedelta(minutes=10 * i)
+        hh_date = ts_date + timedelta(hours=4)
+        lines.append(
+            f"{ts_date.isoformat()},{hh_date.isoformat()},"
+            f"{0.5 + i % 50 / 100},{0.2 + i % 20 / 100},{20 + i % 10},{100 + i % 90}"
+        )
+    return lines
+
+
+def measure(function, *args):
+    """Result of `function`, the bytes it still holds and its peak bytes."""
+    tracemalloc.start()
+    result = function(*args)
+    (retained, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak
+
+
+def write_documents(documents):
+    """Buffers documents like DatapointWriter, without the database."""
+    buffer = []
+    for document in documents:
+        buffer.append(document)
+        if len(buffer) >= DATAPOINT_BATCH_SIZE:
+            buffer = []
+
+
+def main(argv: list[str]) -> int:
+    n_rows = int(argv[1]) if len(argv) > 1 else 100_000
+    lines = make_lines(n_rows)
+    print(f"{n_rows} rows, bytes per row")
+
+    ((datapoints, _), objects_held, _) = measure(extract, lines)
+    print(f"  Datapoint objects: {objects_held / n_rows:.0f} held")
+    (batch, batch_held, _) = measure(DatapointBatch.from_datapoints, datapoints)
+    print(f"  DatapointBatch: {batch_held / n_rows:.0f} held")
+    del datapoints
+
+    (_, _, list_peak) = measure(lambda: write_documents(list(batch.to_documents())))
+    print(f"  writing a list of documents: {list_peak / n_rows:.0f} peak")
+    (_, _, stream_peak) = measure(write_documents, batch.to_documents())
+    print(f"  writing streamed documents: {stream_peak / n_rows:.0f} peak")
+
+    # ingestion holds the extracted datapoints while it writes their documents
+    print(
+        f"  ingestion, objects and a list of documents:"
+        f" {(objects_held + list_peak) / n_rows:.0f}"
+    )
+    print(
+        f"  ingestion, batch and streamed documents:"
+        f" {(batch_held + stream_peak) / n_rows:.0f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,42 @@
+"""Times AnalysisPrep.resolve_duplicates against the original quadratic version.
+
+python -m benchmarks.bench_resolve_duplicates [max quadratic documents]
+
+The quadratic version only runs up to the given number of documents (10000 by
+default); a million documents would take it days.
+"""
+from __future__ import annotations
+
+import random
+import sys
+import time
+
+from AnalysisPrep import resolve_duplicates
+from fixtures.datapoints import make_datapoints, resolve_duplicates_quadratic
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def time_function(function, datapoints: list[dict]) -> float:
+    started = time.perf_counter()
+    function(datapoints)
+    return time.perf_counter() - started
+
+
+def main(argv: list[str]) -> int:
+    max_quadratic = int(argv[1]) if len(argv) > 1 else 10_000
+    rng = random.Random(0)
+    for n in SIZES:
+        # about three uploads of every sample
+        datapoints = make_datapoints(rng, n, n // 3, 30)
+        linear_time = time_function(resolve_duplicates, datapoints)
+        line = f"{n:>9} documents: linear {linear_time:.3f}s"
+        if n <= max_quadratic:
+            quadratic_time = time_function(resolve_duplicates_quadratic, datapoints)
+            line += f", quadratic {quadratic_time:.3f}s"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
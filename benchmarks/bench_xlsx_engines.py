@@ -0,0 +1,94 @@
+"""Compares the openpyxl and streaming XLSX engines of UploadTrigger.
+
+python -m benchmarks.bench_xlsx_engines [rows]
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from itertools import zip_longest
+
+import openpyxl
+
+from utils.columnar import extract_columnar
+from utils.xlsx import StreamingXLSXRowSource, XLSXRowSource
+
+ENGINES = {"openpyxl": XLSXRowSource, "stream": StreamingXLSXRowSource}
+
+
+def write_workbook(path: str, n_rows: int):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(
+        ["ts_datetime", "hh_datetime", "ts_frc", "hh_frc", "ts_wattemp", "ts_cond"]
+    )
+    start = datetime(2022, 1, 1)
+    for i in range(n_rows):
+        ts_date = start + timedelta(minutes=10 * i)
+        sheet.append([ts_date, ts_date + timedelta(hours=4), 0.8, 0.4, 25.0, 150])
+    workbook.save(path)
+
+
+def time_engine(engine, path: str, extract: bool) -> float:
+    started = time.perf_counter()
+    with open(path, "rb") as fp:
+        source = engine(fp)
+        if extract:
+            extract_columnar(source)
+        else:
+            for _ in source.sheet_rows:
+                pass
+        source.close()
+    return time.perf_counter() - started
+
+
+def get_read_peak(engine, path: str) -> int:
+    """Peak traced allocation while the rows are read and dropped one by one."""
+    tracemalloc.start()
+    with open(path, "rb") as fp:
+        source = engine(fp)
+        for _ in source.sheet_rows:
+            pass
+        source.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def same_rows(path: str) -> bool:
+    with open(path, "rb") as fp, open(path, "rb") as stream_fp:
+        sources = [XLSXRowSource(fp), StreamingXLSXRowSource(stream_fp)]
+        same = all(
+            a == b for (a, b) in zip_longest(*(source.sheet_rows for source in sources))
+        )
+        for source in sources:
+            source.close()
+    return same
+
+
+def main(argv: list[str]) -> int:
+    n_rows = int(argv[1]) if len(argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "bench.xlsx")
+        write_workbook(path, n_rows)
+        print(f"{n_rows} rows")
+        for (name, engine) in ENGINES.items():
+            read_time = time_engine(engine, path, extract=False)
+            extract_time = time_engine(engine, path, extract=True)
+            peak = get_read_peak(engine, path)
+            print(
+                f"{name:>8}: read rows {read_time:.2f}s, extract {extract_time:.2f}s,"
+                f" read peak {peak / 1e6:.1f} MB"
+            )
+        if not same_rows(path):
+            print("engines read different rows")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,51 @@
+"""Datapoint documents shared by the tests and the benchmarks."""
+import random
+from datetime import datetime, timedelta
+from functools import partial
+
+
+def datapoint_eq(datapoint1, datapoint2):
+    return (
+        datapoint1["tsDate"] == datapoint2["tsDate"]
+        and datapoint1["hhDate"] == datapoint2["hhDate"]
+    )
+
+
+def resolve_duplicates_quadratic(datapoints: list[dict]) -> list[dict]:
+    """The original remove_duplicates of AnalysisPrep, which compares every pair
+    of datapoints. It returned a Datapoint built from each winning document;
+    this version returns the winning documents themselves."""
+    resolved_datapoints = []
+    for datapoint in datapoints:
+        latest = datapoint
+        duplicates = filter(partial(datapoint_eq, datapoint2=datapoint), datapoints)
+        for d in duplicates:
+            if (
+                d["dateUploaded"] > latest["dateUploaded"]
+                and d["overwriting"]
+                or not datapoint["overwriting"]
+            ):
+                latest = d
+        resolved_datapoints.append(latest)
+
+    return resolved_datapoints
+
+
+def make_datapoints(
+    rng: random.Random, n: int, n_keys: int, n_upload_dates: int
+) -> list[dict]:
+    start = datetime(2022, 1, 1)
+    datapoints = []
+    for i in range(n):
+        ts_date = start + timedelta(hours=rng.randrange(n_keys))
+        datapoints.append(
+            {
+                "tsDate": ts_date,
+                "hhDate": ts_date + timedelta(hours=rng.choice([1, 2])),
+                "tsFrc": i,
+                "overwriting": rng.choice([True, False, 1, 0]),
+                "dateUploaded": start + timedelta(days=rng.randrange(n_upload_dates)),
+            }
+        )
+    datapoints.sort(key=lambda datapoint: datapoint["tsDate"])
+    return datapoints
@@ -0,0 +1,48 @@
+import random
+from datetime import datetime, timedelta
+
+from utils.batch import DatapointBatch
+from utils.standardize import Datapoint
+
+
+def make_documents(rng: random.Random, n: int) -> list[dict]:
+    start = datetime(2022, 1, 1)
+    documents = []
+    for _ in range(n):
+        ts_date = start + timedelta(minutes=rng.randrange(10**6))
+        if rng.random() < 0.2:
+            ts_date += timedelta(microseconds=rng.randrange(1, 1000) * 1000)
+        documents.append(
+            {
+                "tsDate": ts_date,
+                "hhDate": ts_date + timedelta(hours=rng.randrange(1, 4)),
+                "tsFrc": rng.choice([0.5, None, 1, rng.random()]),
+                "hhFrc": rng.choice([0.2, 0, rng.random()]),
+                "tsCond": rng.choice([None, 150, 3.0, 12.5, 0]),
+                "tsTemp": rng.choice([None, 20, 20.0, -3]),
+                "timezoneOffset": rng.choice([0, 3600, -18000, 19800, None]),
+            }
+        )
+    return documents
+
+
+def test_csv_lines_match_datapoints():
+    rng = random.Random(20)
+    for _ in range(300):
+        documents = make_documents(rng, rng.randrange(1, 30))
+        datapoints = [Datapoint.from_document(document) for document in documents]
+        Datapoint.add_timezones(datapoints)
+        batch = DatapointBatch.from_documents(documents)
+        batch.add_timezones()
+        assert list(batch.iter_csv_lines()) == Datapoint.get_csv_lines(datapoints)
+        assert [str(view) for view in batch] == [str(d) for d in datapoints]
+
+
+def test_documents_keep_int_and_float_values():
+    rng = random.Random(21)
+    documents = make_documents(rng, 200)
+    batch = DatapointBatch.from_documents(documents)
+    for (document, written) in zip(documents, batch.to_documents(chunk_size=7)):
+        for key in ["tsFrc", "hhFrc", "tsCond", "tsTemp"]:
+            assert written[key] == document[key]
+            assert type(written[key]) is type(document[key])
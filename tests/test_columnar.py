@@ -0,0 +1,133 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+from utils.batch import EPOCH, ONE_MICROSECOND, DatapointBatch
+from utils.columnar import DateColumn, FloatColumn, extract_columnar
+from utils.standardize import (
+    RowSource,
+    extract,
+    format_date_cell,
+    format_number_cell,
+    iter_row_chunks,
+)
+
+HEADER = ["ts_datetime", "hh_datetime", "ts_frc", "hh_frc", "ts_wattemp", "ts_cond"]
+
+
+class ListRowSource(RowSource):
+    """Typed cells, as a workbook row source yields them."""
+
+    def __init__(self, rows: list[list]):
+        self.cells = rows
+
+    def header(self) -> list[str]:
+        return HEADER
+
+    def rows(self, n_columns: int):
+        for row_number, row in enumerate(self.cells, 2):
+            yield row_number, row + [None] * (n_columns - len(row))
+
+
+def summarize(result):
+    (datapoints, errors) = result
+    return (
+        [str(datapoint) for datapoint in datapoints],
+        [(error.row_number, error.to_csv_line()) for error in errors],
+    )
+
+
+def assert_same_extraction(rows: list[list]):
+    expected = summarize(extract(ListRowSource(rows)))
+    assert summarize(extract_columnar(ListRowSource(rows))) == expected
+
+
+def extract_chunks(rows: list[list], chunk_size: int):
+    batches = []
+    errors = []
+    for chunk in iter_row_chunks(ListRowSource(rows), chunk_size):
+        (chunk_datapoints, chunk_errors) = extract_columnar(chunk)
+        batches.append(chunk_datapoints)
+        errors.extend(chunk_errors)
+    return DatapointBatch.concat(batches), errors
+
+
+def test_bool_cells_are_not_confused_with_numbers():
+    ts_date = datetime(2022, 3, 1, 8)
+    hh_date = ts_date + timedelta(hours=3)
+    for cells in ([True, 1, False, 0], [1, True, 0, False]):
+        rows = [[ts_date, hh_date, cell, 0.2, cell, cell] for cell in cells]
+        assert_same_extraction(rows)
+
+
+def test_mixed_typed_cells_match_rows_engine():
+    rng = random.Random(6)
+    values = [None, "", True, False, 0, 1, 1.0, 0.5, "1", "True", "x", 2, -1]
+    rows = []
+    for _ in range(500):
+        ts_date = datetime(2021, 1, 1) + timedelta(minutes=rng.randrange(10**6))
+        hh_date = rng.choice([ts_date + timedelta(hours=2), True, 1, None])
+        rows.append([ts_date, hh_date] + [rng.choice(values) for _ in range(4)])
+    assert_same_extraction(rows)
+
+
+def test_chunked_extraction_matches_whole_file():
+    rng = random.Random(4)
+    rows = []
+    for _ in range(100):
+        ts_date = datetime(2021, 1, 1) + timedelta(minutes=rng.randrange(10**6))
+        hh_date = ts_date + timedelta(hours=rng.choice([-1, 2, 200]))
+        rows.append(
+            [ts_date.isoformat(" "), hh_date.isoformat(" ")]
+            + [rng.choice(["", "x", "0.3", "0.1", 1, None]) for _ in range(4)]
+        )
+    expected = summarize(extract(ListRowSource(rows)))
+    for chunk_size in (1, 7, 100, 1000):
+        assert summarize(extract_chunks(rows, chunk_size)) == expected
+
+
+def test_number_strings_match_format_number_cell():
+    rng = random.Random(3)
+    values = [None, "", " ", "x", "-0", "+0", "-0.0", "nan", "inf", " 1.5", "1_0"]
+    values += ["1e400", ".5", "5.", "1e", "53.887819914155244", "-75320158895191997525"]
+    for _ in range(200):
+        column = [rng.choice(values) for _ in range(20)]
+        column += [str(rng.uniform(-100, 100)) for _ in range(rng.randrange(5))]
+        parsed = FloatColumn(column)
+        for (i, value) in enumerate(column):
+            number = format_number_cell(value)
+            assert parsed.present[i] == (number is not None)
+            if number is not None and not math.isnan(number):
+                assert parsed.numbers[i] == number
+                assert math.copysign(1, parsed.numbers[i]) == math.copysign(1, number)
+
+
+def test_iso_date_strings_match_format_date_cell():
+    rng = random.Random(5)
+    layouts = [
+        "dddd-dd-dd_dd:dd",
+        "dddd-dd-dd_dd:dd:dd",
+        "dddd-dd-dd_dd:dd:dd.ddd",
+        "dddd-dd-dd_dd:dd:ddsdd:dd",
+        "dddd-dd-dd_dd:dd:dd.dddsdd:dd",
+    ]
+
+    def fill(layout: str) -> str:
+        # mostly small digits, so that many of the dates are valid
+        choices = {
+            "d": "0123456789" if rng.random() < 0.3 else "012",
+            "_": " T",
+            "s": "+-",
+        }
+        return "".join(rng.choice(choices.get(char, [char])) for char in layout)
+
+    for _ in range(1000):
+        layout = rng.choice(layouts)
+        column = [fill(layout) for _ in range(20)] + [None, "", "44000.5"]
+        parsed = DateColumn(column)
+        for (i, value) in enumerate(column):
+            date = format_date_cell(value)
+            assert parsed.present[i] == (date is not None)
+            if date is not None:
+                assert parsed.micros[i] == (date - EPOCH) // ONE_MICROSECOND
+                assert parsed.offsets[i] == date.utcoffset().total_seconds()
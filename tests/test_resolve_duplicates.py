@@ -0,0 +1,20 @@
+import random
+
+from AnalysisPrep import resolve_duplicates
+from fixtures.datapoints import make_datapoints, resolve_duplicates_quadratic
+
+
+def test_matches_quadratic_implementation():
+    rng = random.Random(1)
+    for _ in range(2000):
+        datapoints = make_datapoints(
+            rng, rng.randrange(1, 40), rng.randrange(1, 8), rng.randrange(1, 5)
+        )
+        expected = resolve_duplicates_quadratic(datapoints)
+        resolved = resolve_duplicates(datapoints)
+        # the same documents, not just equal ones
+        assert [id(d) for d in resolved] == [id(d) for d in expected]
+
+
+def test_empty():
+    assert not resolve_duplicates([])
@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, time, timedelta
+
+import openpyxl
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from utils.xlsx import StreamingXLSXRowSource, XLSXRowSource
+
+
+def random_cell(rng: random.Random):
+    date = datetime(2022, 1, 1) + timedelta(seconds=rng.randrange(10**8))
+    return rng.choice(
+        [
+            None,
+            date,
+            date.replace(microsecond=rng.randrange(10**6)),
+            44600.25,
+            3,
+            -2.5,
+            "text",
+            "",
+            True,
+            False,
+            "ünï",
+            time(10, 30),
+            "=notformula",
+            1e20,
+        ]
+    )
+
+
+def write_random_workbook(rng: random.Random, path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    if rng.random() < 0.3:
+        other = workbook.create_sheet("other")
+        other.append(["x"])
+        if rng.random() < 0.5:
+            workbook.active = 1
+            sheet = other
+    if rng.random() < 0.2:
+        workbook.epoch = CALENDAR_MAC_1904
+    first_row = rng.choice([1, 1, 1, 3])
+    for row in range(rng.randrange(0, 40)):
+        if rng.random() < 0.1:
+            continue
+        for column in range(1, rng.randrange(1, 9)):
+            if rng.random() < 0.8:
+                sheet.cell(row=first_row + row, column=column, value=random_cell(rng))
+    if rng.random() < 0.3:
+        sheet.cell(row=3, column=1, value=44600.5).number_format = "yyyy-mm-dd hh:mm"
+        sheet.cell(row=4, column=1, value=1.5).number_format = "[h]:mm:ss"
+    workbook.save(path)
+
+
+def read_rows(source_class, path) -> list[tuple]:
+    with open(path, "rb") as fp:
+        source = source_class(fp)
+        rows = list(source.sheet_rows)
+        source.close()
+    return rows
+
+
+def test_streaming_engine_reads_the_same_rows_as_openpyxl(tmp_path):
+    rng = random.Random(7)
+    path = tmp_path / "random.xlsx"
+    for _ in range(100):
+        write_random_workbook(rng, path)
+        assert read_rows(StreamingXLSXRowSource, path) == read_rows(XLSXRowSource, path)
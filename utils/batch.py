@@ -0,0 +1,356 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from .standardize import Datapoint, get_timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+DATE_FIELDS = ["ts_date", "hh_date"]
+NUMBER_FIELDS = ["ts_frc", "hh_frc", "ts_cond", "ts_temp"]
+FIELDS = [*DATE_FIELDS, *NUMBER_FIELDS, "timezone_offset"]
+
+# one packed record per datapoint; a date is its UTC instant in microseconds
+# since the epoch plus the utc offset (in seconds) of the datetime it came from
+ROW_DTYPE = np.dtype(
+    [
+        ("ts_date", np.int64),
+        ("hh_date", np.int64),
+        ("ts_date_offset", np.int32),
+        ("hh_date_offset", np.int32),
+        ("ts_frc", np.float64),
+        ("hh_frc", np.float64),
+        ("ts_cond", np.float64),
+        ("ts_temp", np.float64),
+        # seconds, like the date offsets it is copied to by add_timezones
+        ("timezone_offset", np.int32),
+        # bit i set: FIELDS[i] is None
+        ("missing", np.uint8),
+        # bit i set: DATE_FIELDS[i] is a naive datetime
+        ("naive", np.uint8),
+        # bit i set: NUMBER_FIELDS[i] is an int rather than a float
+        ("integer", np.uint8),
+    ],
+    align=False,
+)
+
+DOCUMENT_KEYS = {
+    "tsDate": "ts_date",
+    "tsFrc": "ts_frc",
+    "tsCond": "ts_cond",
+    "tsTemp": "ts_temp",
+    "hhDate": "hh_date",
+    "hhFrc": "hh_frc",
+    "timezoneOffset": "timezone_offset",
+}
+FIELD_DOCUMENT_KEYS = {field: key for (key, field) in DOCUMENT_KEYS.items()}
+# rows converted to documents at once by DatapointBatch.to_documents
+DOCUMENT_CHUNK_SIZE = 1000
+
+
+def format_utc_offset(offset: int) -> str:
+    # as datetime.isoformat renders utcoffset()
+    sign = "-" if offset < 0 else "+"
+    (hours, rest) = divmod(abs(offset), 3600)
+    (minutes, seconds) = divmod(rest, 60)
+    suffix = f"{sign}{hours:02d}:{minutes:02d}"
+    return f"{suffix}:{seconds:02d}" if seconds else suffix
+
+
+class DatapointBatch:
+    """Datapoints stored as one packed NumPy record per row.
+
+    Bulk conversions (documents, CSV lines, timezones) work on whole columns.
+    Indexing and iterating yield `DatapointView`s, which read their row on access.
+    """
+
+    __slots__ = ("rows",)
+
+    def __init__(self, rows: np.ndarray):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> DatapointView:
+        if index < 0:
+            index += len(self.rows)
+        if not 0 <= index < len(self.rows):
+            raise IndexError("datapoint index out of range")
+        return DatapointView(self, index)
+
+    def __iter__(self) -> Iterator[DatapointView]:
+        for index in range(len(self.rows)):
+            yield DatapointView(self, index)
+
+    def take(self, indices) -> DatapointBatch:
+        return DatapointBatch(self.rows[indices])
+
+    @classmethod
+    def concat(cls, batches: Iterable[DatapointBatch]) -> DatapointBatch:
+        return cls(np.concatenate([np.zeros(0, ROW_DTYPE), *(b.rows for b in batches)]))
+
+    def is_missing(self, field: str) -> np.ndarray:
+        return (self.rows["missing"] & (1 << FIELDS.index(field))) != 0
+
+    def is_naive(self, field: str) -> np.ndarray:
+        return (self.rows["naive"] & (1 << DATE_FIELDS.index(field))) != 0
+
+    def is_integer(self, field: str) -> np.ndarray:
+        return (self.rows["integer"] & (1 << NUMBER_FIELDS.index(field))) != 0
+
+    @classmethod
+    def from_datapoints(cls, datapoints: Iterable[Datapoint]) -> DatapointBatch:
+        return cls.from_values(
+            [
+                [getattr(datapoint, field) for field in FIELDS]
+                for datapoint in datapoints
+            ]
+        )
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict]) -> DatapointBatch:
+        keys = [FIELD_DOCUMENT_KEYS[field] for field in FIELDS]
+        return cls.from_values(
+            [[document[key] for key in keys] for document in documents]
+        )
+
+    @classmethod
+    def from_values(cls, values: list[list]) -> DatapointBatch:
+        """Builds a batch from rows of values ordered as FIELDS."""
+        rows = np.zeros(len(values), dtype=ROW_DTYPE)
+        columns = list(zip(*values)) if values else [()] * len(FIELDS)
+        missing = np.zeros(len(values), dtype=np.uint8)
+        naive = np.zeros(len(values), dtype=np.uint8)
+        integer = np.zeros(len(values), dtype=np.uint8)
+        for (bit, field) in enumerate(FIELDS):
+            column = columns[bit]
+            is_missing = np.fromiter(
+                (value is None for value in column), dtype=bool, count=len(values)
+            )
+            missing |= is_missing.astype(np.uint8) << bit
+            if field in DATE_FIELDS:
+                (micros, offsets, is_naive) = split_datetimes(column)
+                rows[field] = micros
+                rows[f"{field}_offset"] = offsets
+                naive |= is_naive.astype(np.uint8) << DATE_FIELDS.index(field)
+            else:
+                rows[field] = [0 if value is None else value for value in column]
+            if field in NUMBER_FIELDS:
+                is_integer = np.fromiter(
+                    (is_int(value) for value in column), dtype=bool, count=len(values)
+                )
+                integer |= is_integer.astype(np.uint8) << NUMBER_FIELDS.index(field)
+        rows["missing"] = missing
+        rows["naive"] = naive
+        rows["integer"] = integer
+        return cls(rows)
+
+    @classmethod
+    def from_columns(
+        cls,
+        dates: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]],
+        numbers: dict[str, tuple[np.ndarray, np.ndarray]],
+        timezone_offsets: np.ndarray,
+    ) -> DatapointBatch:
+        """Builds a batch of timezone-aware datapoints from parsed columns.
+
+        `dates` maps each date field to (present, micros, offsets) and
+        `numbers` each number field to (present, values).
+        """
+        rows = np.zeros(len(timezone_offsets), dtype=ROW_DTYPE)
+        missing = np.zeros(len(rows), dtype=np.uint8)
+        for (bit, field) in enumerate(FIELDS):
+            if field in dates:
+                (present, micros, offsets) = dates[field]
+                rows[field] = micros
+                rows[f"{field}_offset"] = offsets
+            elif field in numbers:
+                (present, values) = numbers[field]
+                rows[field] = np.where(present, values, 0)
+            else:
+                continue
+            missing |= (~present).astype(np.uint8) << bit
+        rows["timezone_offset"] = timezone_offsets
+        rows["missing"] = missing
+        return cls(rows)
+
+    def get_value(self, field: str, index: int):
+        row = self.rows[index]
+        bit = FIELDS.index(field)
+        if row["missing"] & (1 << bit):
+            return None
+        if field in DATE_FIELDS:
+            date = EPOCH + int(row[field]) * ONE_MICROSECOND
+            if row["naive"] & (1 << bit):
+                return date.replace(tzinfo=None)
+            return date.astimezone(get_timezone(int(row[f"{field}_offset"])))
+        if field == "timezone_offset":
+            return int(row[field])
+        if row["integer"] & (1 << NUMBER_FIELDS.index(field)):
+            return int(row[field])
+        return float(row[field])
+
+    def get_object_column(self, field: str) -> list:
+        """Column values as python objects, None where missing; dates are naive UTC."""
+        if field in DATE_FIELDS:
+            values = self.rows[field].astype("datetime64[us]").astype(object)
+        else:
+            values = self.rows[field].astype(object)
+        if field in NUMBER_FIELDS:
+            integer = self.is_integer(field)
+            values[integer] = self.rows[field][integer].astype(np.int64).astype(object)
+        values[self.is_missing(field)] = None
+        return values.tolist()
+
+    def to_documents(
+        self, chunk_size: int = DOCUMENT_CHUNK_SIZE, **kwargs
+    ) -> Iterator[dict]:
+        """Same documents as `Datapoint.to_document`, with dates as naive UTC
+        datetimes, which pymongo stores as the same instants.
+
+        Documents are built `chunk_size` rows at a time as they are consumed, so
+        a writer flushing them in batches holds one chunk of them at once.
+        """
+        keys = list(DOCUMENT_KEYS)
+        chunk_size = max(chunk_size, 1)
+        for start in range(0, len(self.rows), chunk_size):
+            chunk = self.take(slice(start, start + chunk_size))
+            columns = [
+                chunk.get_object_column(field) for field in DOCUMENT_KEYS.values()
+            ]
+            for values in zip(*columns):
+                yield {**dict(zip(keys, values)), **kwargs}
+
+    def get_str_column(self, field: str) -> list[str]:
+        """Column values as `Datapoint.get_str_attr` formats them."""
+        missing = self.is_missing(field)
+        if field in DATE_FIELDS:
+            strings = self.get_isoformat_column(field)
+        else:
+            strings = np.array(
+                list(map(str, self.get_object_column(field))), dtype=object
+            )
+        strings[missing] = ""
+        return strings.tolist()
+
+    def get_isoformat_column(self, field: str) -> np.ndarray:
+        naive = self.is_naive(field)
+        offsets = np.where(naive, 0, self.rows[f"{field}_offset"]).astype(np.int64)
+        local = (self.rows[field] + offsets * 1_000_000).astype("datetime64[us]")
+        whole_seconds = self.rows[field] % 1_000_000 == 0
+        strings = np.where(
+            whole_seconds,
+            np.datetime_as_string(local, unit="s"),
+            np.datetime_as_string(local, unit="us"),
+        ).astype(object)
+        (unique_offsets, inverse) = np.unique(offsets, return_inverse=True)
+        suffixes = np.array(
+            [format_utc_offset(int(offset)) for offset in unique_offsets], dtype=object
+        )[inverse.reshape(-1)]
+        suffixes[naive] = ""
+        return strings + suffixes
+
+    def iter_csv_lines(self) -> Iterator[str]:
+        yield Datapoint.header_line()
+        columns = [
+            self.get_str_column(field) for field in Datapoint.DEFAULT_MAPPING.values()
+        ]
+        yield from map(",".join, zip(*columns))
+
+    def add_timezones(self):
+        """Vectorized `Datapoint.add_timezones`: rows with a timezone offset get
+        their dates' wall time read as UTC and converted to that offset."""
+        rows = self.rows
+        shifted = rows["timezone_offset"] != 0
+        for field in DATE_FIELDS:
+            selected = shifted & ~self.is_missing(field)
+            wall_offsets = np.where(
+                self.is_naive(field), 0, rows[f"{field}_offset"]
+            ).astype(np.int64)
+            rows[field] = np.where(
+                selected, rows[field] + wall_offsets * 1_000_000, rows[field]
+            )
+            rows[f"{field}_offset"] = np.where(
+                selected, rows["timezone_offset"], rows[f"{field}_offset"]
+            )
+            rows["naive"] &= ~np.where(
+                selected, 1 << DATE_FIELDS.index(field), 0
+            ).astype(np.uint8)
+
+
+def is_int(value) -> bool:
+    # bools are ints too, but are stored as the floats they equal
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def split_datetimes(values: Iterable) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """UTC microseconds, utc offsets and naive flags of a column of datetimes."""
+    micros = []
+    offsets = []
+    naive = []
+    for value in values:
+        if value is None:
+            micros.append(0)
+            offsets.append(0)
+            naive.append(False)
+        elif value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+            micros.append((value - EPOCH) // ONE_MICROSECOND)
+            offsets.append(0)
+            naive.append(True)
+        else:
+            micros.append((value - EPOCH) // ONE_MICROSECOND)
+            offsets.append(int(value.utcoffset().total_seconds()))
+            naive.append(False)
+    return (
+        np.array(micros, dtype=np.int64),
+        np.array(offsets, dtype=np.int32),
+        np.array(naive, dtype=bool),
+    )
+
+
+class DatapointView(Datapoint):
+    """A row of a `DatapointBatch`, read through the usual Datapoint attributes."""
+
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch: DatapointBatch, index: int):
+        self.batch = batch
+        self.index = index
+
+    def __reduce__(self):
+        # pickles as a standalone Datapoint rather than with the whole batch
+        return (Datapoint, tuple(getattr(self, name) for name in Datapoint.__slots__))
+
+    @property
+    def ts_date(self):
+        return self.batch.get_value("ts_date", self.index)
+
+    @property
+    def hh_date(self):
+        return self.batch.get_value("hh_date", self.index)
+
+    @property
+    def ts_frc(self):
+        return self.batch.get_value("ts_frc", self.index)
+
+    @property
+    def hh_frc(self):
+        return self.batch.get_value("hh_frc", self.index)
+
+    @property
+    def ts_cond(self):
+        return self.batch.get_value("ts_cond", self.index)
+
+    @property
+    def ts_temp(self):
+        return self.batch.get_value("ts_temp", self.index)
+
+    @property
+    def timezone_offset(self):
+        return self.batch.get_value("timezone_offset", self.index)
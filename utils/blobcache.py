@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+from azure.storage.blob import BlobClient
+
+from .streaming import download_to_file
+
+BLOB_CACHE_DIR = os.getenv(
+    "BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "swot-blob-cache")
+)
+# total size of the cached blobs; 0 disables the cache
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+ENTRY_SUFFIX = ".blob"
+ENTRY_LOCK_COUNT = 64
+
+
+def link_file(src: str, dest: str):
+    """Hard-links `src` to `dest`, replacing `dest`; copies across filesystems."""
+    try:
+        os.remove(dest)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class BlobCache:
+    """Worker-local disk cache of blobs, bounded by total size.
+
+    An entry is named after the blob and its ETag, so a blob that changed is a
+    miss and its stale versions are dropped. Entries live in `directory`, which
+    the worker processes of a host share; the least recently used ones are
+    removed once `max_bytes` is exceeded.
+
+    Callers get a hard link to the entry rather than the entry itself, so an
+    entry can be evicted while its readers still use their copy. Those copies
+    must be treated as read-only.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # striped by entry, so that concurrent misses download a blob once
+        self.entry_locks = [threading.Lock() for _ in range(ENTRY_LOCK_COUNT)]
+        self.hits = 0
+        self.misses = 0
+
+    def get_blob_key(self, blob_client: BlobClient) -> str:
+        name = (
+            f"{blob_client.account_name}/{blob_client.container_name}"
+            f"/{blob_client.blob_name}"
+        )
+        return hashlib.sha256(name.encode()).hexdigest()
+
+    def get_entry_path(self, blob_client: BlobClient, etag: str) -> str:
+        etag_hash = hashlib.sha256(etag.encode()).hexdigest()[:16]
+        return os.path.join(
+            self.directory,
+            f"{self.get_blob_key(blob_client)}-{etag_hash}{ENTRY_SUFFIX}",
+        )
+
+    def get_entry_lock(self, entry_path: str) -> threading.Lock:
+        return self.entry_locks[hash(entry_path) % len(self.entry_locks)]
+
+    def count(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def fetch(self, blob_client: BlobClient, path: str) -> str:
+        """Writes the current version of a blob to `path`, from the cache if it
+        holds that version. Returns `path`."""
+        if self.max_bytes <= 0:
+            download_to_file(blob_client, path)
+            return path
+
+        properties = blob_client.get_blob_properties()
+        if properties.size > self.max_bytes:
+            download_to_file(blob_client, path, properties=properties)
+            return path
+
+        entry_path = self.get_entry_path(blob_client, properties.etag)
+        with self.get_entry_lock(entry_path):
+            try:
+                link_file(entry_path, path)
+                os.utime(entry_path)
+                self.count(hit=True)
+                logging.info("blob cache hit: %s", blob_client.blob_name)
+                return path
+            except FileNotFoundError:
+                self.count(hit=False)
+                logging.info("blob cache miss: %s", blob_client.blob_name)
+
+            os.makedirs(self.directory, exist_ok=True)
+            part_path = f"{entry_path}.{uuid.uuid4().hex}.part"
+            try:
+                download_to_file(blob_client, part_path, properties=properties)
+                os.replace(part_path, entry_path)
+            finally:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+            link_file(entry_path, path)
+
+        self.evict(keep=entry_path)
+        return path
+
+    def evict(self, keep: str | None = None, max_bytes: int | None = None):
+        """Removes the stale versions of `keep`'s blob, then the least recently
+        used entries until the cache fits in `max_bytes` (by default its own)."""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        stale_prefix = os.path.basename(keep).split("-")[0] if keep else None
+        total = 0
+        # most recently used first
+        for (_, size, entry_path) in sorted(entries, reverse=True):
+            if entry_path == keep:
+                total += size
+                continue
+            stale = stale_prefix and os.path.basename(entry_path).startswith(
+                stale_prefix
+            )
+            if not stale and total + size <= max_bytes:
+                total += size
+                continue
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# shared by the invocations of a worker
+blob_cache = BlobCache(BLOB_CACHE_DIR, BLOB_CACHE_MAX_BYTES)
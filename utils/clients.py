@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from azure.storage.blob import BlobServiceClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from sendgrid import SendGridAPIClient
+
+# seconds between pings of a pooled mongo client before it is handed out again
+CLIENT_HEALTH_CHECK_INTERVAL = int(os.getenv("CLIENT_HEALTH_CHECK_INTERVAL", "60"))
+
+
+class ClientPool:
+    """Process-wide clients keyed by connection string.
+
+    Functions hosts keep the worker process alive between invocations, so a
+    client created by one invocation (with its TLS sessions, DNS/SRV lookups and
+    mongo topology) is reused by the next ones instead of being rebuilt.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], Any],
+        health_check: Callable[[Any], bool] | None = None,
+    ):
+        self.factory = factory
+        self.health_check = health_check
+        self.clients: dict[str, Any] = {}
+        self.last_checked: dict[str, float] = {}
+        # guards the dicts only; pings and factories run outside of it
+        self.lock = threading.Lock()
+        # one client is built at a time per key, so that callers of a key being
+        # built wait for it instead of building their own
+        self.key_locks: dict[str, threading.Lock] = {}
+
+    def get(self, key: str):
+        with self.lock:
+            client = self.clients.get(key)
+            check_due = client is not None and self.claim_health_check(key)
+        if check_due and not self.health_check(client):
+            self.discard(key, client)
+            client = None
+        if client is None:
+            client = self.create(key)
+        return client
+
+    def create(self, key: str):
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                client = self.clients.get(key)
+            if client is None:
+                client = self.factory(key)
+                with self.lock:
+                    self.clients[key] = client
+                    self.last_checked[key] = time.monotonic()
+            return client
+
+    def claim_health_check(self, key: str) -> bool:
+        """Whether the client of `key` is due a health check, which the caller
+        then runs; the others keep using the client in the meantime."""
+        if not self.health_check:
+            return False
+        now = time.monotonic()
+        if now - self.last_checked.get(key, 0) < CLIENT_HEALTH_CHECK_INTERVAL:
+            return False
+        self.last_checked[key] = now
+        return True
+
+    def discard(self, key: str, client):
+        with self.lock:
+            if self.clients.get(key) is client:
+                del self.clients[key]
+                self.last_checked.pop(key, None)
+        close_client(client)
+
+    def close_all(self):
+        with self.lock:
+            clients = list(self.clients.values())
+            self.clients = {}
+            self.last_checked = {}
+        for client in clients:
+            close_client(client)
+
+    def forget(self):
+        # clients must not be shared with a forked child, which builds its own
+        self.clients = {}
+        self.last_checked = {}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+
+def close_client(client):
+    close = getattr(client, "close", None)
+    if not close:
+        return
+    try:
+        close()
+    except Exception as ex:
+        logging.warning("failed to close %s: %s", type(client).__name__, ex)
+
+
+def is_mongo_client_healthy(client: MongoClient) -> bool:
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError as ex:
+        logging.warning("discarding unhealthy mongo client: %s", ex)
+        return False
+
+
+mongo_clients = ClientPool(MongoClient, is_mongo_client_healthy)
+blob_service_clients = ClientPool(BlobServiceClient.from_connection_string)
+sendgrid_clients = ClientPool(SendGridAPIClient)
+POOLS = [mongo_clients, blob_service_clients, sendgrid_clients]
+
+
+def get_mongo_client(connection_string: str) -> MongoClient[Dict[str, Any]]:
+    return mongo_clients.get(connection_string)
+
+
+def get_blob_service_client(connection_string: str) -> BlobServiceClient:
+    return blob_service_clients.get(connection_string)
+
+
+def get_sendgrid_client(api_key: str) -> SendGridAPIClient:
+    return sendgrid_clients.get(api_key)
+
+
+def close_all_clients():
+    for pool in POOLS:
+        pool.close_all()
+
+
+def forget_all_clients():
+    for pool in POOLS:
+        pool.forget()
+
+
+atexit.register(close_all_clients)
+os.register_at_fork(after_in_child=forget_all_clients)
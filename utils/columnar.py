@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .batch import EPOCH, ONE_MICROSECOND, DatapointBatch
+from .standardize import (
+    DATE_PATTERNS,
+    MAX_STORE,
+    RowSource,
+    StandardizationError,
+    as_row_source,
+    detect_date_pattern,
+    format_date_column,
+    format_number_cell,
+    get_column_indices,
+)
+
+
+def factorize(values: list) -> tuple[np.ndarray, list]:
+    """The code of each row of a column and the column's distinct values.
+
+    A missing (None) cell has code -1, which indexes the None appended last.
+    """
+    # pandas hashes True like 1 and False like 0, so bool cells are keyed by
+    # their text, which is also how format_number_cell and format_date_cell read them
+    keys = [str(value) if isinstance(value, bool) else value for value in values]
+    codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+    return codes, [*uniques.tolist(), None]
+
+
+def is_text_column(values: list) -> bool:
+    """Whether a column only holds strings and None, as a CSV column does."""
+    return pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty")
+
+
+def parse_numbers(values: list) -> tuple[np.ndarray, np.ndarray]:
+    """`format_number_cell` of every value, as present and number arrays.
+
+    Text is converted at once; what the bulk conversion cannot tell apart takes
+    the per-cell path.
+    """
+    present = np.zeros(len(values), dtype=bool)
+    numbers = np.full(len(values), np.nan)
+    rest = np.arange(len(values))
+    if is_text_column(values):
+        cells = np.asarray(values, dtype=object)
+        # None and empty cells are missing under both parsers
+        rest = np.flatnonzero(pd.notna(cells) & (cells != ""))
+        try:
+            # numpy casts str objects with float(), as format_number_cell does
+            numbers[rest] = cells[rest].astype(float)
+            present[rest] = True
+            rest = rest[:0]
+        except ValueError:
+            # pd.to_numeric rounds some long decimals differently from float(),
+            # so it only picks out the numbers; strings it leaves out (such as
+            # "nan" or "1_0") take the per-cell path
+            is_numeric = pd.notna(pd.to_numeric(cells[rest], errors="coerce"))
+            numbers[rest[is_numeric]] = cells[rest[is_numeric]].astype(float)
+            present[rest[is_numeric]] = True
+            rest = rest[~is_numeric]
+    for i in rest.tolist():
+        number = format_number_cell(values[i])
+        if number is not None:
+            present[i] = True
+            numbers[i] = number
+    return present, numbers
+
+
+# the DATE_PATTERNS layouts, as templates ("0" for a digit, " " for the
+# separator, "+" for the offset sign) and the format of their local time
+DATE_LAYOUTS = {
+    16: ("0000-00-00 00:00", "%Y-%m-%d %H:%M"),
+    19: ("0000-00-00 00:00:00", "%Y-%m-%d %H:%M:%S"),
+    23: ("0000-00-00 00:00:00.000", "%Y-%m-%d %H:%M:%S.%f"),
+    25: ("0000-00-00 00:00:00+00:00", "%Y-%m-%d %H:%M:%S"),
+    29: ("0000-00-00 00:00:00.000+00:00", "%Y-%m-%d %H:%M:%S.%f"),
+}
+
+PATTERN_LENGTHS = {pattern: length for (length, pattern) in DATE_PATTERNS.items()}
+
+
+def to_char_codes(strings: list[str], length: int) -> np.ndarray:
+    """One row of code points per string, for strings `length` characters long."""
+    return np.array(strings, dtype=f"<U{length}").view(np.uint32).reshape(-1, length)
+
+
+def match_layout(chars: np.ndarray, template: str) -> np.ndarray:
+    """Which rows of code points fit a DATE_LAYOUTS template.
+
+    Rows whose date fromisoformat would reject although pandas parses it (year 0,
+    leap seconds, offsets of a day or more) do not match.
+    """
+    digits = chars.astype(np.int64) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+    expected = np.array([ord(char) for char in template], dtype=np.uint32)
+    matches = np.where(
+        np.array([char == "0" for char in template]), is_digit, chars == expected
+    )
+    matches[:, 10] = (chars[:, 10] == ord(" ")) | (chars[:, 10] == ord("T"))
+    if template.endswith("+00:00"):
+        matches[:, -6] = (chars[:, -6] == ord("+")) | (chars[:, -6] == ord("-"))
+    matched = matches.all(axis=1) & digits[:, :4].any(axis=1)
+    if len(template) >= 19:
+        matched &= digits[:, 17] < 6
+    if template.endswith("+00:00"):
+        matched &= (digits[:, -5] * 10 + digits[:, -4] < 24) & (digits[:, -2] < 6)
+    return matched
+
+
+def get_utc_offsets(chars: np.ndarray) -> np.ndarray:
+    """UTC offsets in seconds of rows of code points ending in "+HH:MM"."""
+    digits = chars[:, -5:].astype(np.int64) - ord("0")
+    seconds = (digits[:, 0] * 10 + digits[:, 1]) * 3600 + (
+        digits[:, 3] * 10 + digits[:, 4]
+    ) * 60
+    return np.where(chars[:, -6] == ord("-"), -seconds, seconds)
+
+
+def parse_iso_dates(
+    strings: list[str], length: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Parses the strings in the DATE_LAYOUTS[length] layout at once.
+
+    Returns which strings were parsed, their microseconds since the epoch and
+    their UTC offsets in seconds. Only strings `datetime.fromisoformat` parses to
+    the same date are marked parsed.
+    """
+    (template, date_format) = DATE_LAYOUTS[length]
+    parsed = np.zeros(len(strings), dtype=bool)
+    micros = np.zeros(len(strings), dtype=np.int64)
+    offsets = np.zeros(len(strings), dtype=np.int64)
+    indices = np.flatnonzero(
+        np.fromiter(map(len, strings), dtype=np.int64, count=len(strings)) == length
+    )
+    if len(indices) == 0:
+        return parsed, micros, offsets
+
+    chars = to_char_codes([strings[i] for i in indices.tolist()], length)
+    matched = match_layout(chars, template)
+    n_local = length
+    if template.endswith("+00:00"):
+        n_local -= 6
+        offsets[indices] = get_utc_offsets(chars)
+    # pandas parses the local time; the offset is applied from the characters
+    local = chars[:, :n_local].copy()
+    local[:, 10] = ord(" ")
+    dates = pd.to_datetime(
+        local.view(f"<U{n_local}").ravel(), format=date_format, errors="coerce"
+    )
+    matched &= pd.notna(dates)
+    indices = indices[matched]
+    parsed[indices] = True
+    micros[indices] = (
+        dates[matched].to_numpy().astype("datetime64[us]").astype(np.int64)
+        - offsets[indices] * 1_000_000
+    )
+    offsets[~parsed] = 0
+    return parsed, micros, offsets
+
+
+def parse_dates(values: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """`format_date_column` of the values, as present, micros and offset arrays.
+
+    Strings in the column's ISO layout are parsed at once; other values (serial
+    days, typed cells, outliers) take the per-cell path.
+    """
+    present = np.zeros(len(values), dtype=bool)
+    # microseconds since the epoch, for comparisons across timezones
+    micros = np.zeros(len(values), dtype=np.int64)
+    offsets = np.zeros(len(values), dtype=np.int64)
+    if is_text_column(values):
+        pattern = detect_date_pattern(values)
+        if pattern is not None:
+            length = PATTERN_LENGTHS[pattern]
+            strings = ["" if value is None else value for value in values]
+            (present, micros, offsets) = parse_iso_dates(strings, length)
+    rest = np.flatnonzero(~present).tolist()
+    for (i, date) in zip(rest, format_date_column([values[i] for i in rest])):
+        if date is not None:
+            present[i] = True
+            micros[i] = (date - EPOCH) // ONE_MICROSECOND
+            offsets[i] = int(date.utcoffset().total_seconds())
+    return present, micros, offsets
+
+
+class FloatColumn:
+    def __init__(self, values: list):
+        codes, uniques = factorize(values)
+        (present, numbers) = parse_numbers(uniques)
+        self.present = present[codes]
+        self.numbers = numbers[codes]
+
+
+class DateColumn:
+    def __init__(self, values: list):
+        codes, uniques = factorize(values)
+        (present, micros, offsets) = parse_dates(uniques)
+        self.present = present[codes]
+        self.micros = micros[codes]
+        self.offsets = offsets[codes]
+
+
+def extract_columnar(
+    source: RowSource | Iterable[str],
+) -> tuple[DatapointBatch, list]:
+    """Same output as `standardize.extract`, with parsing and validation done per column."""
+    source = as_row_source(source)
+    indices = get_column_indices(source.header())
+    rows = list(source.rows(max(indices.values()) + 1))
+
+    row_numbers = [row_number for row_number, _ in rows]
+    columns = {col: [line[index] for _, line in rows] for col, index in indices.items()}
+    ts_date = DateColumn(columns["ts_datetime"])
+    hh_date = DateColumn(columns["hh_datetime"])
+    ts_frc = FloatColumn(columns["ts_frc"])
+    hh_frc = FloatColumn(columns["hh_frc"])
+    ts_cond = FloatColumn(columns["ts_cond"])
+    ts_temp = FloatColumn(columns["ts_wattemp"])
+
+    both_dates = ts_date.present & hh_date.present
+    timezone_offsets = np.where(
+        both_dates & (ts_date.offsets == hh_date.offsets), ts_date.offsets, 0
+    )
+
+    # vectorized equivalent of standardize.get_bad_columns
+    now = (datetime.now(timezone.utc) - EPOCH) // ONE_MICROSECOND
+    bad_dates = both_dates & (
+        (ts_date.micros > hh_date.micros)
+        | (hh_date.micros - ts_date.micros >= MAX_STORE * 1_000_000)
+    )
+    bad_ts_date = ~ts_date.present | (ts_date.micros > now) | bad_dates
+    bad_hh_date = ~hh_date.present | (hh_date.micros > now) | bad_dates
+    with np.errstate(invalid="ignore"):
+        bad_frcs = (
+            (ts_frc.numbers != 0)
+            & (hh_frc.numbers != 0)
+            & (hh_frc.numbers - ts_frc.numbers > 0.06)
+        )
+        bad_ts_frc = ~ts_frc.present | (ts_frc.numbers <= 0) | bad_frcs
+        bad_hh_frc = ~hh_frc.present | (hh_frc.numbers < 0) | bad_frcs
+    bad_masks = {
+        "ts_date": bad_ts_date,
+        "hh_date": bad_hh_date,
+        "ts_frc": bad_ts_frc,
+        "hh_frc": bad_hh_frc,
+    }
+    bad_rows = bad_ts_date | bad_hh_date | bad_ts_frc | bad_hh_frc
+
+    batch = DatapointBatch.from_columns(
+        {
+            "ts_date": (ts_date.present, ts_date.micros, ts_date.offsets),
+            "hh_date": (hh_date.present, hh_date.micros, hh_date.offsets),
+        },
+        {
+            "ts_frc": (ts_frc.present, ts_frc.numbers),
+            "hh_frc": (hh_frc.present, hh_frc.numbers),
+            "ts_cond": (ts_cond.present, ts_cond.numbers),
+            "ts_temp": (ts_temp.present, ts_temp.numbers),
+        },
+        timezone_offsets,
+    )
+
+    datapoints = batch.take(np.flatnonzero(~bad_rows))
+    bad_indices = np.flatnonzero(bad_rows)
+    bad_batch = batch.take(bad_indices)
+    errors: list[StandardizationError] = []
+    for (error_index, i) in enumerate(bad_indices.tolist()):
+        bad_columns = {col for col, mask in bad_masks.items() if mask[i]}
+        errors.append(
+            StandardizationError(row_numbers[i], bad_batch[error_index], bad_columns)
+        )
+
+    return datapoints, errors
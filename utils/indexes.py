@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, MongoClient
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+# indexes of the hot queries, by collection:
+# - datapoints: fieldsite equality, then tsDate range and sort (AnalysisPrep),
+#   and the upsert key of utils.ingestion
+# - areas, countries: the lookups of swotutils.get_locations_from_fieldsite_id
+INDEXES = {
+    "datapoints": [
+        # not unique, as datapoints written in insert mode hold duplicates
+        IndexModel(
+            [("fieldsite", ASCENDING), ("tsDate", ASCENDING), ("hhDate", ASCENDING)]
+        ),
+        # the key of the datapoints written in upsert mode, which are marked
+        # deduplicated; the marker is part of the key pattern only to tell the
+        # index apart from the one above
+        IndexModel(
+            [
+                ("fieldsite", ASCENDING),
+                ("tsDate", ASCENDING),
+                ("hhDate", ASCENDING),
+                ("deduplicated", ASCENDING),
+            ],
+            unique=True,
+            partialFilterExpression={"deduplicated": True},
+        ),
+    ],
+    "areas": [IndexModel([("fieldsites", ASCENDING)])],
+    "countries": [IndexModel([("areas", ASCENDING)])],
+}
+
+# fields of a datapoint used by AnalysisPrep: DatapointBatch.from_documents and
+# the duplicate resolution
+DATAPOINT_PROJECTION = {
+    "_id": 0,
+    "tsDate": 1,
+    "hhDate": 1,
+    "tsFrc": 1,
+    "hhFrc": 1,
+    "tsCond": 1,
+    "tsTemp": 1,
+    "timezoneOffset": 1,
+    "overwriting": 1,
+    "dateUploaded": 1,
+}
+
+indexed_collections: set[str] = set()
+
+
+def ensure_indexes(
+    collection: Collection[Dict[str, Any]], indexes: list[IndexModel] | None = None
+):
+    """Creates the indexes of a collection, once per process."""
+    if collection.full_name in indexed_collections:
+        return
+    indexes = INDEXES.get(collection.name, []) if indexes is None else indexes
+    if indexes:
+        collection.create_indexes(indexes)
+    indexed_collections.add(collection.full_name)
+
+
+def ensure_all_indexes(db: Database[Dict[str, Any]]):
+    for collection_name in INDEXES:
+        ensure_indexes(db.get_collection(collection_name))
+
+
+def get_datapoint_filter(fieldsite_id, start_date, end_date) -> dict:
+    """Datapoints of a fieldsite sampled within a dataset's date range."""
+    date_filter = {"$lt": end_date}
+    if start_date:
+        date_filter["$gt"] = start_date
+    return {
+        "tsDate": date_filter,
+        "overwriting": {"$ne": None},
+        "dateUploaded": {"$ne": None},
+        "fieldsite": fieldsite_id,
+    }
+
+
+def iter_plan_stages(plan) -> Iterator[str]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from iter_plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from iter_plan_stages(value)
+
+
+def explain_hot_queries(db: Database[Dict[str, Any]]) -> dict[str, list[str]]:
+    """Stages of the winning plan of each hot query."""
+    fieldsite_id = ObjectId()
+    end_date = datetime.utcnow()
+    cursors = {
+        "datapoints": db.get_collection("datapoints")
+        .find(
+            get_datapoint_filter(
+                fieldsite_id, end_date - timedelta(days=365), end_date
+            ),
+            DATAPOINT_PROJECTION,
+        )
+        .sort("tsDate", 1),
+        "areas": db.get_collection("areas").find({"fieldsites": fieldsite_id}),
+        "countries": db.get_collection("countries").find({"areas": ObjectId()}),
+    }
+    return {
+        name: list(iter_plan_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+        for name, cursor in cursors.items()
+    }
+
+
+def find_collection_scans(db: Database[Dict[str, Any]]) -> list[str]:
+    return [
+        name for name, stages in explain_hot_queries(db).items() if "COLLSCAN" in stages
+    ]
+
+
+def main(argv: list[str]) -> int:
+    """python -m utils.indexes <connection string> [--create]"""
+    db = MongoClient(argv[1]).get_database()
+    if "--create" in argv:
+        ensure_all_indexes(db)
+    for name, stages in explain_hot_queries(db).items():
+        print(f"{name}: {' <- '.join(stages)}")
+    collection_scans = find_collection_scans(db)
+    if collection_scans:
+        print(f"collection scans: {', '.join(collection_scans)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterable
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from .indexes import ensure_indexes
+
+DATAPOINT_BATCH_SIZE = int(os.getenv("DATAPOINT_BATCH_SIZE", "1000"))
+# "insert" stores every uploaded row and leaves duplicates to AnalysisPrep,
+# which replaces each row by the row winning its key, so a key uploaded n times
+# is analysed n times.
+# "upsert" keeps a single datapoint per DATAPOINT_KEY, resolved at write time and
+# held unique by an index, so each key is analysed once. Datapoints stored in
+# insert mode must be converted with `python -m utils.ingestion <connection
+# string> --migrate` once every worker writes in upsert mode.
+DATAPOINT_INGEST_MODE = os.getenv("DATAPOINT_INGEST_MODE", "insert")
+DATAPOINT_KEY = ["fieldsite", "tsDate", "hhDate"]
+# the fields read by the migration
+MIGRATION_PROJECTION = {
+    "tsDate": 1,
+    "hhDate": 1,
+    "overwriting": 1,
+    "dateUploaded": 1,
+    "deduplicated": 1,
+}
+
+
+def get_upsert_operation(document: dict) -> UpdateOne:
+    """Stores a datapoint under its key unless the stored one wins, as it does
+    in AnalysisPrep's resolve_duplicates: an overwriting datapoint wins over any
+    other datapoint and over overwriting datapoints uploaded before it, any
+    other datapoint only wins over datapoints that are not overwriting."""
+    # the marker selects the unique index, so that a concurrent insert of the
+    # same key fails and is retried by the server as an update
+    key = {field: document[field] for field in DATAPOINT_KEY}
+    key["deduplicated"] = True
+    stored_wins = {"$eq": ["$overwriting", True]}
+    if document.get("overwriting"):
+        stored_wins = {
+            "$and": [stored_wins, {"$gt": ["$dateUploaded", document["dateUploaded"]]}]
+        }
+    # an update pipeline, so that the rule is applied atomically by the server;
+    # its expressions all see the stored document, which on insert is the key
+    return UpdateOne(
+        key,
+        [
+            {
+                "$set": {
+                    field: {"$cond": [stored_wins, f"${field}", {"$literal": value}]}
+                    for (field, value) in document.items()
+                    if field not in key
+                }
+            }
+        ],
+        upsert=True,
+    )
+
+
+def is_stored_winner(stored: dict, document: dict) -> bool:
+    """The rule of `get_upsert_operation`, for documents read back."""
+    if not stored["overwriting"]:
+        return False
+    return (
+        not document["overwriting"] or stored["dateUploaded"] > document["dateUploaded"]
+    )
+
+
+def migrate_to_upsert(collection: Collection[Dict[str, Any]]) -> int:
+    """Converts the datapoints stored in insert mode to upsert mode.
+
+    The datapoints of every key are resolved in the order they were stored,
+    as if they had been upserted; the winner is marked deduplicated and the
+    others are deleted. Returns the number of deleted datapoints.
+    """
+    ensure_indexes(collection)
+    n_deleted = 0
+    for fieldsite in collection.distinct("fieldsite", {"deduplicated": {"$ne": True}}):
+        winners: dict[tuple, dict] = {}
+        losers = []
+        for document in collection.find(
+            {"fieldsite": fieldsite}, MIGRATION_PROJECTION
+        ).sort("_id", 1):
+            key = (document["tsDate"], document["hhDate"])
+            stored = winners.get(key)
+            if stored is not None and is_stored_winner(stored, document):
+                losers.append(document["_id"])
+                continue
+            if stored is not None:
+                losers.append(stored["_id"])
+            winners[key] = document
+
+        # the losers go first, as one of them may hold the key in the index
+        for start in range(0, len(losers), DATAPOINT_BATCH_SIZE):
+            n_deleted += collection.delete_many(
+                {"_id": {"$in": losers[start : start + DATAPOINT_BATCH_SIZE]}}
+            ).deleted_count
+        unmarked = [
+            document["_id"]
+            for document in winners.values()
+            if not document.get("deduplicated")
+        ]
+        for start in range(0, len(unmarked), DATAPOINT_BATCH_SIZE):
+            collection.update_many(
+                {"_id": {"$in": unmarked[start : start + DATAPOINT_BATCH_SIZE]}},
+                {"$set": {"deduplicated": True}},
+            )
+        logging.info(
+            "migrated fieldsite %s: %d datapoints kept, %d deleted",
+            fieldsite,
+            len(winners),
+            len(losers),
+        )
+    return n_deleted
+
+
+class BatchFailure:
+    def __init__(
+        self, batch_number: int, batch_size: int, n_written: int, message: str
+    ):
+        self.batch_number = batch_number
+        self.batch_size = batch_size
+        self.n_written = n_written
+        self.message = message
+
+    def __str__(self):
+        return (
+            f"batch {self.batch_number}: wrote {self.n_written} of "
+            f"{self.batch_size} documents ({self.message})"
+        )
+
+
+class DatapointWriter:
+    """Buffers datapoint documents and writes them with unordered bulk inserts.
+
+    A failing batch is recorded in `failures` and logged; the remaining batches
+    are still written so that one bad batch does not drop the whole upload.
+    With `upsert`, batches are written in order with `get_upsert_operation`.
+    """
+
+    def __init__(
+        self,
+        collection: Collection[Dict[str, Any]],
+        batch_size: int = DATAPOINT_BATCH_SIZE,
+        upsert: bool = DATAPOINT_INGEST_MODE == "upsert",
+    ):
+        self.collection = collection
+        self.batch_size = max(batch_size, 1)
+        self.upsert = upsert
+        self.buffer: list[dict] = []
+        self.n_batches = 0
+        self.n_written = 0
+        self.failures: list[BatchFailure] = []
+        if upsert:
+            ensure_indexes(collection)
+
+    def write(self, document: dict):
+        self.buffer.append(document)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, documents: Iterable[dict]):
+        for document in documents:
+            self.write(document)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        self.n_batches += 1
+        try:
+            if self.upsert:
+                # ordered, so that the rows of a key are resolved in upload order
+                result = self.collection.bulk_write(
+                    [get_upsert_operation(document) for document in batch]
+                )
+                self.n_written += result.upserted_count + result.matched_count
+            else:
+                result = self.collection.insert_many(batch, ordered=False)
+                self.n_written += len(result.inserted_ids)
+        except BulkWriteError as err:
+            n_written = (
+                err.details.get("nInserted", 0)
+                + err.details.get("nUpserted", 0)
+                + err.details.get("nMatched", 0)
+            )
+            n_errors = len(err.details.get("writeErrors", []))
+            self.record_failure(batch, n_written, f"{n_errors} write errors")
+        except PyMongoError as err:
+            self.record_failure(batch, 0, str(err))
+
+    def record_failure(self, batch: list[dict], n_written: int, message: str):
+        self.n_written += n_written
+        failure = BatchFailure(self.n_batches, len(batch), n_written, message)
+        self.failures.append(failure)
+        logging.error("failed to write datapoint %s", failure)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self) -> DatapointWriter:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv: list[str]) -> int:
+    """python -m utils.ingestion <connection string> --migrate"""
+    if "--migrate" not in argv:
+        print(main.__doc__)
+        return 1
+    db = MongoClient(argv[1]).get_database()
+    n_deleted = migrate_to_upsert(db.get_collection("datapoints"))
+    print(f"deleted {n_deleted} duplicate datapoints")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -5,9 +5,9 @@ import logging
 import os
 from urllib.parse import quote_plus
 
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Attachment, Disposition, FileName, FileType, Mail
 
+from utils.clients import get_sendgrid_client
 from utils.standardize import Datapoint, UploadedFileSummary
 
 
@@ -50,7 +50,7 @@ def send_mail(email, uploaded_file_summaries, country_name, area_name, fieldsite
     message.attachment = attachments
 
     try:
-        sg = SendGridAPIClient(os.environ.get("SENDGRID_API_KEY"))
+        sg = get_sendgrid_client(os.environ.get("SENDGRID_API_KEY"))
         sg.send(message)
         logging.info("sent upload confirmation email to %s", email)
     except Exception as err:
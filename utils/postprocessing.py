@@ -1,6 +1,14 @@
 import numpy as np
 import pandas as pd
 
+RISK_COLUMN = "probability<=0.20"
+# scenarios of the ANN output, named as in its {dataset_id}_{case}.csv files
+CASES = [
+    f"{case}_case_{timing}" for case in ["worst", "average"] for timing in ["am", "pm"]
+]
+# FRC targets of the rows of each scenario file
+FRC_TARGETS = np.arange(0.2, 2.05, 0.05)
+
 
 def get_current_safety(input_df):
     """This function calculates the values labelled output 1 on the marked up figure."""
@@ -10,29 +18,56 @@ def get_current_safety(input_df):
     return safety
 
 
-def get_risk(frc_target, ann_frames):
+def read_case_risks(case_files):
+    """Reads the risk at every FRC target from each scenario file (path or buffer)."""
+    return [
+        pd.read_csv(f, usecols=[RISK_COLUMN])[RISK_COLUMN].tolist() for f in case_files
+    ]
+
+
+def get_risk_curve(case_risks):
+    """Safety range of the four scenarios at every FRC target at once.
+
+    The scenario risks are stacked into one (scenario, target) array and reduced
+    over the scenarios, so `safety_min[i]`-`safety_max[i]` is the range that
+    `get_risk` reports for `frc_targets[i]`.
+    """
+    risks = np.asarray(case_risks, dtype=float)
+    n_targets = min(risks.shape[1], len(FRC_TARGETS))
+    risks = risks[:, :n_targets]
+    return {
+        "frc_targets": FRC_TARGETS[:n_targets].round(2).tolist(),
+        "safety_min": ((1 - risks.max(axis=0)) * 100).tolist(),
+        "safety_max": ((1 - risks.min(axis=0)) * 100).tolist(),
+    }
+
+
+def get_risk(frc_target, case_risks):
     """This function gets the safety range (Labelled 3 on the marked up dash). The output is a two value range showing the
     minimum and maximum predicted safety of unsafe drinking water for the four scenarios. On the dashboard this should
     print as:
     str(safety_range[0])+"-"+str(safety_range[1])
     """
-    FRC_targets = np.arange(0.2, 2.05, 0.05)
-    target_check_arg = np.argmin(np.abs(frc_target - FRC_targets))
-    risks = []
-    for df in ann_frames:
-        risks.append(df["probability<=0.20"].loc[target_check_arg])
+    target_check_arg = np.argmin(np.abs(frc_target - FRC_TARGETS))
+    risks = np.asarray(case_risks, dtype=float)[:, target_check_arg]
     safety_range = [(1 - np.max(risks)) * 100, (1 - np.min(risks)) * 100]
     return safety_range
 
 
-def get_water_safety(frc_target, case_filepaths, input_file):
-    ann_frames = []
-    for f in case_filepaths:
-        ann_frames.append(pd.read_csv(f))
-    input_df = pd.read_csv(input_file)
+def get_water_safety(frc_target, case_risks, input_file):
+    """`case_risks` holds the risk column of each scenario (see `read_case_risks`);
+    only the hh_frc column of the input file (path or buffer) is parsed, from
+    a memory map when it is a path."""
+    input_df = pd.read_csv(
+        input_file, usecols=["hh_frc"], memory_map=isinstance(input_file, str)
+    )
     safety_range = None
     if frc_target is not None:
-        safety_range = get_risk(frc_target, ann_frames)
+        safety_range = get_risk(frc_target, case_risks)
     safe_percent = get_current_safety(input_df)
 
-    return {"safety_range": safety_range, "safe_percent": safe_percent}
+    return {
+        "safety_range": safety_range,
+        "safe_percent": safe_percent,
+        "safety_curve": get_risk_curve(case_risks),
+    }
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+from importlib import metadata
+from typing import Any, Dict, Iterable
+
+from azure.core.exceptions import AzureError
+from azure.storage.blob import BlobClient, ContainerClient
+from pymongo import IndexModel, ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+
+from .indexes import ensure_indexes
+
+# analyses are reused when their input CSV and these parameters are identical
+HASHED_PARAMETERS = [
+    "NETWORK_COUNT",
+    "EPOCHS",
+    "MAX_DURATION",
+    "CONFIDENCE_LEVEL",
+]
+# import packages of the analysis code; the versions installed (and, for git
+# installs, their commits) are hashed too, so a model change is not served the
+# results of the previous model
+ANALYSIS_PACKAGES = ["swotann", "swoteo"]
+# set by a deployment to invalidate the results of its predecessors at once
+ANALYSIS_CODE_VERSION = os.getenv("ANALYSIS_CODE_VERSION", "")
+# dataset fields copied from the cached analysis onto the dataset reusing it
+CACHED_FIELDS = ["ann", "eo"]
+# entries not used for this many seconds are evicted by mongo's TTL monitor
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(30 * 24 * 3600)))
+ANALYSIS_CACHE_ENABLED = bool(int(os.getenv("ANALYSIS_CACHE_ENABLED", "1")))
+# seconds to wait for the server-side copies of a cached result's artifacts
+ANALYSIS_CACHE_COPY_TIMEOUT = int(os.getenv("ANALYSIS_CACHE_COPY_TIMEOUT", "300"))
+COPY_POLL_INTERVAL = 1
+
+# mongo's error code for an existing index with different options
+INDEX_OPTIONS_CONFLICT = 85
+
+
+def get_analysis_hash(lines: Iterable[str], analysis_parameters: dict) -> str:
+    """Content address of an analysis: its input CSV lines and parameters."""
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line.encode())
+        digest.update(b"\n")
+    parameters = {key: analysis_parameters.get(key) for key in HASHED_PARAMETERS}
+    parameters["codeVersions"] = get_code_versions()
+    digest.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def get_distribution_version(name: str) -> str:
+    distribution = metadata.distribution(name)
+    version = distribution.version
+    direct_url = distribution.read_text("direct_url.json")
+    if direct_url:
+        commit_id = json.loads(direct_url).get("vcs_info", {}).get("commit_id")
+        if commit_id:
+            version = f"{version}+{commit_id}"
+    return version
+
+
+@lru_cache(maxsize=None)
+def get_code_versions() -> dict[str, list[str] | str]:
+    """Installed versions of ANALYSIS_PACKAGES, plus ANALYSIS_CODE_VERSION."""
+    distributions = metadata.packages_distributions()
+    versions: dict[str, list[str] | str] = {
+        package: sorted(
+            f"{name}=={get_distribution_version(name)}"
+            for name in distributions.get(package, [])
+        )
+        for package in ANALYSIS_PACKAGES
+    }
+    versions["deployment"] = ANALYSIS_CODE_VERSION
+    return versions
+
+
+def get_cache_collection(db: Database[Dict[str, Any]]):
+    collection = db.get_collection("analysisresults")
+    indexes = [IndexModel("lastUsed", expireAfterSeconds=ANALYSIS_CACHE_TTL)]
+    try:
+        ensure_indexes(collection, indexes)
+    except OperationFailure as ex:
+        if ex.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        # ANALYSIS_CACHE_TTL changed since the index was created
+        db.command(
+            "collMod",
+            collection.name,
+            index={
+                "keyPattern": {"lastUsed": 1},
+                "expireAfterSeconds": ANALYSIS_CACHE_TTL,
+            },
+        )
+        ensure_indexes(collection, indexes)
+    return collection
+
+
+def find_cached_result(db: Database[Dict[str, Any]], analysis_hash: str):
+    """Returns the cached result of an analysis, marking it as recently used."""
+    return get_cache_collection(db).find_one_and_update(
+        {"_id": analysis_hash},
+        {"$set": {"lastUsed": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def store_result(
+    db: Database[Dict[str, Any]],
+    analysis_hash: str,
+    dataset: dict,
+    case_risks: dict[str, list[float]] | None,
+):
+    get_cache_collection(db).replace_one(
+        {"_id": analysis_hash},
+        {
+            "datasetId": str(dataset["_id"]),
+            "fields": {key: dataset[key] for key in CACHED_FIELDS if key in dataset},
+            "caseRisks": case_risks,
+            "lastUsed": datetime.utcnow(),
+        },
+        upsert=True,
+    )
+
+
+def evict_result(db: Database[Dict[str, Any]], analysis_hash: str):
+    get_cache_collection(db).delete_one({"_id": analysis_hash})
+
+
+def wait_for_copy(blob_client: BlobClient, copy: dict) -> bool:
+    """Waits for a server-side copy to finish, aborting it after
+    ANALYSIS_CACHE_COPY_TIMEOUT seconds. Returns whether it succeeded."""
+    status = copy["copy_status"]
+    deadline = time.monotonic() + ANALYSIS_CACHE_COPY_TIMEOUT
+    while status == "pending":
+        if time.monotonic() > deadline:
+            blob_client.abort_copy(copy["copy_id"])
+            return False
+        time.sleep(COPY_POLL_INTERVAL)
+        status = blob_client.get_blob_properties().copy.status
+    return status == "success"
+
+
+def copy_result_blobs(
+    container_client: ContainerClient, src_dataset_id: str, dest_dataset_id: str
+) -> bool:
+    """Server-side copies the artifacts of one dataset to another dataset's directory.
+
+    Blob names embed the dataset id, which is replaced as well. Returns False
+    when the source artifacts are gone or a copy did not complete.
+    """
+    if src_dataset_id == dest_dataset_id:
+        return True
+    try:
+        copies = []
+        for blob in container_client.list_blobs(name_starts_with=f"{src_dataset_id}/"):
+            src_client = container_client.get_blob_client(blob.name)
+            dest_client = container_client.get_blob_client(
+                blob.name.replace(src_dataset_id, dest_dataset_id)
+            )
+            copies.append(
+                (dest_client, dest_client.start_copy_from_url(src_client.url))
+            )
+        for (dest_client, copy) in copies:
+            if not wait_for_copy(dest_client, copy):
+                logging.warning(
+                    "failed to copy cached result %s", dest_client.blob_name
+                )
+                return False
+    except AzureError as ex:
+        logging.warning("failed to copy cached results of %s: %s", src_dataset_id, ex)
+        return False
+    return len(copies) > 0
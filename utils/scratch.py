@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from .blobcache import BlobCache, blob_cache
+
+SCRATCH_ROOT = os.getenv(
+    "SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), "swot-scratch")
+)
+# bytes the scratch directories and the blob cache may take up together
+SCRATCH_QUOTA_BYTES = int(os.getenv("SCRATCH_QUOTA_BYTES", str(8 * 1024 * 1024 * 1024)))
+
+
+def get_disk_usage(paths: Iterable[str]) -> int:
+    """Bytes of the files under `paths`, counting hard-linked files once."""
+    seen = set()
+    total = 0
+    for path in paths:
+        for (dirpath, _, filenames) in os.walk(path):
+            for filename in filenames:
+                try:
+                    stat = os.lstat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    continue
+                if (stat.st_dev, stat.st_ino) not in seen:
+                    seen.add((stat.st_dev, stat.st_ino))
+                    total += stat.st_size
+    return total
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ScratchSpace:
+    """Scratch directories of the analysis invocations running on a host.
+
+    `directory` hands out a fresh directory under `root` and removes it when
+    the invocation ends, however it ends. Before that, directories left behind
+    by dead workers are removed and, if the scratch directories and the blob
+    cache together exceed `quota_bytes`, blob cache entries are evicted, least
+    recently used first. Directories of running invocations are never evicted.
+    """
+
+    def __init__(self, root: str, quota_bytes: int, cache: BlobCache):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.active: set[str] = set()
+        self.created = 0
+        self.released_bytes = 0
+        self.reclaimed_bytes = 0
+        self.peak_bytes = 0
+        self.over_quota = 0
+
+    @contextmanager
+    def directory(self, name: str) -> Iterator[str]:
+        self.reclaim()
+        os.makedirs(self.root, exist_ok=True)
+        # the pid in the name tells the directories of dead workers apart
+        with self.lock:
+            path = tempfile.mkdtemp(prefix=f"{name}-{os.getpid()}-", dir=self.root)
+            self.active.add(path)
+            self.created += 1
+        try:
+            yield path
+        finally:
+            size = get_disk_usage([path])
+            shutil.rmtree(path, ignore_errors=True)
+            with self.lock:
+                self.active.discard(path)
+                self.released_bytes += size
+                self.peak_bytes = max(self.peak_bytes, size)
+            logging.info(
+                "released scratch directory %s (%d bytes), scratch metrics: %s",
+                path,
+                size,
+                self.get_metrics(),
+            )
+
+    def is_orphaned(self, path: str) -> bool:
+        try:
+            pid = int(os.path.basename(path).rsplit("-", 2)[1])
+        except (IndexError, ValueError):
+            return False
+        if pid == os.getpid():
+            return path not in self.active
+        return not is_process_alive(pid)
+
+    def get_usage(self) -> int:
+        return get_disk_usage([self.root, self.cache.directory])
+
+    def reclaim(self):
+        """Removes orphaned directories, then evicts blob cache entries while
+        the quota is exceeded."""
+        orphans = []
+        if os.path.isdir(self.root):
+            with os.scandir(self.root) as it:
+                with self.lock:
+                    orphans = [
+                        entry.path
+                        for entry in it
+                        if entry.is_dir() and self.is_orphaned(entry.path)
+                    ]
+        for path in orphans:
+            size = get_disk_usage([path])
+            shutil.rmtree(path, ignore_errors=True)
+            with self.lock:
+                self.reclaimed_bytes += size
+            logging.warning("removed orphaned scratch directory %s", path)
+
+        excess = self.get_usage() - self.quota_bytes
+        if excess <= 0:
+            return
+        cache_bytes = get_disk_usage([self.cache.directory])
+        self.cache.evict(max_bytes=max(0, cache_bytes - excess))
+        evicted_bytes = cache_bytes - get_disk_usage([self.cache.directory])
+        with self.lock:
+            self.reclaimed_bytes += evicted_bytes
+        if self.get_usage() > self.quota_bytes:
+            with self.lock:
+                self.over_quota += 1
+            logging.warning(
+                "scratch usage exceeds its quota of %d bytes", self.quota_bytes
+            )
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            metrics = {
+                "active_directories": len(self.active),
+                "created_directories": self.created,
+                "released_bytes": self.released_bytes,
+                "reclaimed_bytes": self.reclaimed_bytes,
+                "peak_directory_bytes": self.peak_bytes,
+                "over_quota": self.over_quota,
+                "blob_cache_hits": self.cache.hits,
+                "blob_cache_misses": self.cache.misses,
+            }
+        metrics["usage_bytes"] = self.get_usage()
+        return metrics
+
+
+# shared by the invocations of a worker
+scratch_space = ScratchSpace(SCRATCH_ROOT, SCRATCH_QUOTA_BYTES, blob_cache)
@@ -1,8 +1,39 @@
 from __future__ import annotations
 
 import re
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta, timezone
-from typing import Type, TypedDict
+from itertools import islice
+from typing import Iterable, Iterator, Type, TypedDict
+
+MAX_STORE = 5 * 24 * 3600  # two days in seconds
+
+# the ISO layouts format_plain_date accepts, by the length it tells them apart by;
+# strings matching one exactly parse to the same datetime with fromisoformat
+DATE_PATTERNS = {
+    length: re.compile(
+        r"[0-9]{4}-[0-9]{2}-[0-9]{2}[ T][0-9]{2}:[0-9]{2}" + suffix, re.ASCII
+    )
+    for (length, suffix) in [
+        (16, ""),
+        (19, r":[0-9]{2}"),
+        (23, r":[0-9]{2}\.[0-9]{3}"),
+        (25, r":[0-9]{2}[+-][0-9]{2}:[0-5][0-9]"),
+        (29, r":[0-9]{2}\.[0-9]{3}[+-][0-9]{2}:[0-5][0-9]"),
+    ]
+}
+# number of values of a column sampled to detect its date format
+DATE_FORMAT_SAMPLE_SIZE = 20
+
+# one tzinfo per utc offset (in seconds), shared by all datapoints
+timezones: dict[int, timezone] = {0: timezone.utc}
+
+
+def get_timezone(offset: int) -> timezone:
+    tzinfo = timezones.get(offset)
+    if tzinfo is None:
+        tzinfo = timezones[offset] = timezone(timedelta(seconds=offset))
+    return tzinfo
 
 
 class JSONDatapoint(TypedDict):
@@ -34,6 +65,16 @@ class Datapoint(object):
         "ts_cond": "ts_cond",
     }
 
+    __slots__ = (
+        "ts_date",
+        "hh_date",
+        "ts_frc",
+        "hh_frc",
+        "ts_cond",
+        "ts_temp",
+        "timezone_offset",
+    )
+
     def __init__(
         self,
         ts_date: datetime,
@@ -151,17 +192,26 @@ class Datapoint(object):
 
     @staticmethod
     def get_csv_lines(datapoints: list[Datapoint]) -> list[str]:
-        lines = [Datapoint.header_line()]
+        return list(Datapoint.iter_csv_lines(datapoints))
+
+    @staticmethod
+    def iter_csv_lines(datapoints: Iterable[Datapoint]) -> Iterator[str]:
+        yield Datapoint.header_line()
         for datapoint in datapoints:
-            lines.append(str(datapoint))
-        return lines
+            yield str(datapoint)
 
     @staticmethod
-    def add_timezones(datapoints: list[Datapoint]):
+    def add_timezones(datapoints: Iterable[Datapoint]):
+        """Reads the dates of datapoints with a timezone offset as UTC and
+        converts them to that offset. See DatapointBatch.add_timezones for
+        the columnar version."""
+        groups: dict[int, list[Datapoint]] = {}
         for datapoint in datapoints:
-            timezone_offset = datapoint.timezone_offset
-            if timezone_offset:
-                tzinfo = timezone(offset=timedelta(seconds=timezone_offset))
+            if datapoint.timezone_offset:
+                groups.setdefault(datapoint.timezone_offset, []).append(datapoint)
+        for (timezone_offset, group) in groups.items():
+            tzinfo = get_timezone(timezone_offset)
+            for datapoint in group:
                 datapoint.ts_date = datapoint.ts_date.replace(
                     tzinfo=timezone.utc
                 ).astimezone(tzinfo)
@@ -259,8 +309,69 @@ def try_format(num_string: str, cast_type):
         return None
 
 
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def format_date_cell(value) -> datetime | None:
+    # cells are strings when read from text, typed values when read from a workbook
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if not value.tzinfo:
+            value = value.replace(tzinfo=timezone.utc)
+        return round_time(value)
+    if is_number(value):
+        return format_unknown_date(value)
+    return format_unknown_date(str(value))
+
+
+def detect_date_pattern(values: list) -> re.Pattern | None:
+    """The date pattern most of a sample of a column's strings match, if any."""
+    counts = dict.fromkeys(DATE_PATTERNS, 0)
+    sample = [value for value in values if isinstance(value, str)]
+    for value in sample[:DATE_FORMAT_SAMPLE_SIZE]:
+        pattern = DATE_PATTERNS.get(len(value))
+        if pattern and pattern.fullmatch(value):
+            counts[len(value)] += 1
+    length = max(counts, key=counts.__getitem__)
+    return DATE_PATTERNS[length] if counts[length] else None
+
+
+def format_date_column(values: list) -> list[datetime | None]:
+    """`format_date_cell` of every value, detecting the column's format once.
+
+    Strings in the detected format are parsed with `datetime.fromisoformat`;
+    other values (serial days, typed cells, outliers) take the per-cell path.
+    """
+    pattern = detect_date_pattern(values)
+    if pattern is None:
+        return [format_date_cell(value) for value in values]
+    dates = []
+    for value in values:
+        date = None
+        if isinstance(value, str) and pattern.fullmatch(value):
+            try:
+                date = datetime.fromisoformat(value)
+            except ValueError:
+                pass
+        if date is None:
+            date = format_date_cell(value)
+        elif not date.tzinfo:
+            date = date.replace(tzinfo=timezone.utc)
+        dates.append(date)
+    return dates
+
+
+def format_number_cell(value) -> float | None:
+    if value is None or isinstance(value, str):
+        return try_format(value, float)
+    if is_number(value):
+        return float(value)
+    return try_format(str(value), float)
+
+
 def get_bad_columns(datapoint: Datapoint):
-    MAX_STORE = 5*24 * 3600  # two days in seconds
     bad_columns = set()
     now = datetime.now(timezone.utc)
     # if ts date is null or in the future
@@ -304,36 +415,110 @@ def get_bad_columns(datapoint: Datapoint):
     return bad_columns
 
 
-def extract(filename: str) -> tuple[list[Datapoint], list]:
-    datapoints = []
-    errors: list[StandardizationError] = []
-
-    file = open(filename, "r")
-    first_line = file.readline().rstrip("\n")
-    first_line_columns = first_line.split(",")
+def get_column_indices(header_columns: list[str]) -> dict[str, int]:
     indices = {}
     for col in Datapoint.DEFAULT_COLUMNS:
         indices[col] = [
-            i for i, column_name in enumerate(first_line_columns) if col in column_name
+            i for i, column_name in enumerate(header_columns) if col in column_name
         ][0]
+    return indices
 
-    for row_number, l in enumerate(file, 2):
+
+def split_rows(lines: Iterable[str], n_columns: int) -> Iterator[tuple[int, list]]:
+    for row_number, l in enumerate(lines, 2):
         # Skip over lines without six elements and empty lines
         l = l.rstrip("\n")
-        if not l or re.match("^,*$", l):
+        if not l.strip(","):
             continue
 
         line = l.strip().split(",")
 
-        for _ in range(len(line), max(indices.values())+1):
+        for _ in range(len(line), n_columns):
             line.append(None)
 
-        ts_date = format_unknown_date(line[indices["ts_datetime"]])
-        hh_date = format_unknown_date(line[indices["hh_datetime"]])
-        ts_frc = try_format(line[indices["ts_frc"]], float)
-        hh_frc = try_format(line[indices["hh_frc"]], float)
-        ts_cond = try_format(line[indices["ts_cond"]], float)
-        ts_temp = try_format(line[indices["ts_wattemp"]], float)
+        yield row_number, line
+
+
+class RowSource(ABC):
+    """Header and data rows of an uploaded sheet, read in that order.
+
+    `rows` yields the 1-based row number and the cells of every non-empty row,
+    padded with None to at least `n_columns` cells. `close` releases what the
+    source reads from.
+    """
+
+    @abstractmethod
+    def header(self) -> list[str]:
+        pass
+
+    @abstractmethod
+    def rows(self, n_columns: int) -> Iterator[tuple[int, list]]:
+        pass
+
+    def close(self):
+        pass
+
+
+class CSVRowSource(RowSource):
+    def __init__(self, lines: Iterable[str]):
+        self.lines = iter(lines)
+
+    def header(self) -> list[str]:
+        return next(self.lines, "").rstrip("\n").split(",")
+
+    def rows(self, n_columns: int) -> Iterator[tuple[int, list]]:
+        return split_rows(self.lines, n_columns)
+
+
+def as_row_source(source: RowSource | Iterable[str]) -> RowSource:
+    if isinstance(source, RowSource):
+        return source
+    return CSVRowSource(source)
+
+
+class RowChunk(RowSource):
+    """Rows already read from another source, under that source's header."""
+
+    def __init__(self, header: list[str], rows: list[tuple[int, list]]):
+        self.header_columns = header
+        self.chunk_rows = rows
+
+    def header(self) -> list[str]:
+        return self.header_columns
+
+    def rows(self, n_columns: int) -> Iterator[tuple[int, list]]:
+        return iter(self.chunk_rows)
+
+
+def iter_row_chunks(
+    source: RowSource | Iterable[str], chunk_size: int
+) -> Iterator[RowChunk]:
+    """Reads a source `chunk_size` rows at a time, so that extracting the chunks
+    one by one holds a bounded part of the file."""
+    source = as_row_source(source)
+    header = source.header()
+    rows = source.rows(max(get_column_indices(header).values()) + 1)
+    while True:
+        chunk = list(islice(rows, max(chunk_size, 1)))
+        if not chunk:
+            return
+        yield RowChunk(header, chunk)
+
+
+def extract(source: RowSource | Iterable[str]) -> tuple[list[Datapoint], list]:
+    datapoints = []
+    errors: list[StandardizationError] = []
+
+    source = as_row_source(source)
+    indices = get_column_indices(source.header())
+
+    for row_number, line in source.rows(max(indices.values()) + 1):
+        ts_date = format_date_cell(line[indices["ts_datetime"]])
+        hh_date = format_date_cell(line[indices["hh_datetime"]])
+        ts_frc = format_number_cell(line[indices["ts_frc"]])
+        hh_frc = format_number_cell(line[indices["hh_frc"]])
+        ts_cond = format_number_cell(line[indices["ts_cond"]])
+        ts_temp = format_number_cell(line[indices["ts_wattemp"]])
         timezone_offset = get_timezone_offset(ts_date, hh_date)
 
         datapoint = Datapoint(
@@ -348,5 +533,4 @@ def extract(filename: str) -> tuple[list[Datapoint], list]:
         else:
             datapoints.append(datapoint)
 
-    file.close()
     return datapoints, errors
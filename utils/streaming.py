@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import codecs
+import hashlib
+import io
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+
+from azure.core import MatchConditions
+from azure.storage.blob import BlobBlock, BlobClient, BlobProperties, ContentSettings
+
+# bytes buffered before they are staged as one block of a block blob
+BLOB_BLOCK_SIZE = int(os.getenv("BLOB_BLOCK_SIZE", str(4 * 1024 * 1024)))
+# size of the ranges download_to_file requests, and how many it requests at once
+BLOB_DOWNLOAD_CHUNK_SIZE = int(
+    os.getenv("BLOB_DOWNLOAD_CHUNK_SIZE", str(4 * 1024 * 1024))
+)
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "4"))
+
+
+class BlobIntegrityError(Exception):
+    pass
+
+
+def iter_lines(chunks: Iterable[bytes], encoding: str = "utf-8-sig") -> Iterator[str]:
+    """Decodes a stream of byte chunks into lines, one chunk at a time.
+
+    Newlines are translated the same way as a file opened in text mode, so the
+    lines match what iterating over the downloaded file would have produced.
+    """
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(encoding)(), translate=True
+    )
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_blob_lines(blob_client: BlobClient, encoding: str = "utf-8-sig"):
+    return iter_lines(blob_client.download_blob().chunks(), encoding)
+
+
+def download_to_file(
+    blob_client: BlobClient,
+    path: str,
+    chunk_size: int = BLOB_DOWNLOAD_CHUNK_SIZE,
+    concurrency: int = BLOB_DOWNLOAD_CONCURRENCY,
+    properties: BlobProperties | None = None,
+) -> BlobProperties:
+    """Downloads a blob into a file in concurrent ranged chunks.
+
+    Each chunk is written at its offset in the file, so the blob is never held
+    in memory as a whole and the file can be memory-mapped once written. Every
+    range is pinned to the ETag read up front, and the file is checked against
+    the blob's Content-MD5 when it has one. Pass `properties` to download the
+    version they describe without reading them again.
+
+    Returns the properties of the downloaded version of the blob.
+    """
+    if properties is None:
+        properties = blob_client.get_blob_properties()
+    with open(path, "wb") as fp:
+        fp.truncate(properties.size)
+
+    def download_chunk(offset: int):
+        downloader = blob_client.download_blob(
+            offset,
+            min(chunk_size, properties.size - offset),
+            etag=properties.etag,
+            match_condition=MatchConditions.IfNotModified,
+        )
+        with open(path, "r+b") as fp:
+            fp.seek(offset)
+            downloader.readinto(fp)
+
+    offsets = range(0, properties.size, chunk_size)
+    if concurrency <= 1 or len(offsets) <= 1:
+        for offset in offsets:
+            download_chunk(offset)
+    else:
+        with ThreadPoolExecutor(min(concurrency, len(offsets))) as executor:
+            # consumed so that the first failed chunk is raised
+            list(executor.map(download_chunk, offsets))
+
+    content_md5 = properties.content_settings.content_md5
+    if content_md5 and get_file_md5(path) != bytes(content_md5):
+        raise BlobIntegrityError(
+            f"downloaded {blob_client.blob_name} does not match its Content-MD5"
+        )
+    return properties
+
+
+def get_file_md5(path: str) -> bytes:
+    digest = hashlib.md5()
+    with open(path, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.digest()
+
+
+class BlockBlobWriter:
+    """Writes text to a block blob as it is produced.
+
+    Text is buffered until `block_size` bytes are reached and then staged as a
+    block; `close` stages the rest and commits the block list, with the MD5 of
+    the whole content. The blob is left untouched when the writer exits with an
+    exception.
+    """
+
+    def __init__(
+        self,
+        blob_client: BlobClient,
+        block_size: int = BLOB_BLOCK_SIZE,
+        content_type: str = "text/csv",
+    ):
+        self.blob_client = blob_client
+        self.block_size = block_size
+        self.content_type = content_type
+        self.buffer = bytearray()
+        self.block_ids: list[str] = []
+        self.md5 = hashlib.md5()
+
+    def write(self, text: str):
+        self.buffer += text.encode()
+        if len(self.buffer) >= self.block_size:
+            self.stage()
+
+    def write_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """Writes newline-separated lines as they are consumed, passing them on."""
+        for (i, line) in enumerate(lines):
+            self.write(f"\n{line}" if i else line)
+            yield line
+
+    def stage(self):
+        if not self.buffer:
+            return
+        # block ids of a blob must all have the same length
+        block_id = f"{len(self.block_ids):08d}"
+        self.blob_client.stage_block(block_id, self.buffer)
+        self.md5.update(self.buffer)
+        self.block_ids.append(block_id)
+        self.buffer = bytearray()
+
+    def close(self):
+        self.stage()
+        self.blob_client.commit_block_list(
+            [BlobBlock(block_id) for block_id in self.block_ids],
+            content_settings=ContentSettings(
+                self.content_type, content_md5=bytearray(self.md5.digest())
+            ),
+        )
+
+    def __enter__(self) -> BlockBlobWriter:
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
@@ -4,20 +4,33 @@ import json
 import logging
 import mimetypes
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from enum import Enum
-from tempfile import NamedTemporaryFile
+from functools import partial
 from typing import Any, Dict, TypedDict
 
 import requests
-from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
 from bson import ObjectId
-from pymongo import MongoClient
 from pymongo.database import Database
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Content, Mail
 
-from .postprocessing import get_water_safety
+from .blobcache import blob_cache
+from .cache import LRUCache
+from .clients import get_blob_service_client, get_mongo_client, get_sendgrid_client
+from .postprocessing import CASES, get_water_safety, read_case_risks
+from .scratch import scratch_space
+
+# files uploaded at once by upload_files, and chunks uploaded at once per file
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "8"))
+UPLOAD_BLOB_CONCURRENCY = int(os.getenv("UPLOAD_BLOB_CONCURRENCY", "2"))
+LOCATION_CACHE_SIZE = int(os.getenv("LOCATION_CACHE_SIZE", "1024"))
+LOCATION_CACHE_TTL = int(os.getenv("LOCATION_CACHE_TTL", "3600"))
+
+# fieldsite id -> LocationInfo, shared by the invocations of a worker
+location_cache = LRUCache(LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL)
 
 
 class Status(Enum):
@@ -30,6 +43,50 @@ class AnalysisMethod(Enum):
     EO = "eo"
 
 
+class DatasetContext:
+    """Dataset, user and location documents of one invocation, fetched lazily.
+
+    Each document is queried at most once; `invalidate` drops the cached
+    dataset after it has been written to.
+    """
+
+    def __init__(self, db: Database[Dict[str, Any]], dataset_id: str):
+        self.db = db
+        self.dataset_id = dataset_id
+        self.cached_dataset = None
+        self.cached_user = None
+        self.cached_locations = None
+
+    @property
+    def dataset(self):
+        if self.cached_dataset is None:
+            self.cached_dataset = self.db.get_collection("datasets").find_one(
+                {"_id": ObjectId(self.dataset_id)}
+            )
+        return self.cached_dataset
+
+    @property
+    def user(self):
+        if self.cached_user is None:
+            self.cached_user = self.db.get_collection("users").find_one(
+                {"_id": self.dataset["user"]}
+            )
+        return self.cached_user
+
+    @property
+    def locations(self) -> LocationInfo:
+        if self.cached_locations is None:
+            self.cached_locations = get_locations_from_fieldsite_id(
+                self.dataset["fieldsite"], self.db
+            )
+        return self.cached_locations
+
+    def invalidate(self):
+        # the user and fieldsite of a dataset never change, so only the
+        # dataset document itself goes stale
+        self.cached_dataset = None
+
+
 class AnalysisUtils:
     def __init__(
         self,
@@ -52,76 +109,95 @@ class AnalysisUtils:
         self.dataset_id = dataset_id
         self.sg_template_id = sg_template_id
         self.sg_api_key = sg_api_key
-        self.sg_client = SendGridAPIClient(self.sg_api_key)
+        self.sg_client = get_sendgrid_client(self.sg_api_key)
         self.weburl = weburl
         self.dest_container = dest_container
         self.src_container = src_container
         self.blob_name = blob_name
 
-        self.blob_service_client = BlobServiceClient.from_connection_string(
-            self.azure_storage_key
-        )
+        self.blob_service_client = get_blob_service_client(self.azure_storage_key)
         self.blob_result_cc = self.blob_service_client.get_container_client(
             self.dest_container
         )
         self.blob_input_cc = self.blob_service_client.get_container_client(
             self.src_container
         )
-        self.mongo_client = MongoClient(self.mongodb_connection_str)
+        self.mongo_client = get_mongo_client(self.mongodb_connection_str)
         self.db = self.mongo_client.get_database()
         self.dataset_collection = self.db.get_collection("datasets")
         self.max_duration = max_duration
         self.confidence_level = confidence_level
         self.rg_name = rg_name
         self.error_recepient = error_recepient
-        self.locations = get_locations_from_fieldsite_id(
-            self.get_fieldsite_id(), self.db
-        )
+        self.context = DatasetContext(self.db, self.dataset_id)
 
-    def upload_files(self, directory_name: str, file_paths: list[str]):
-        for out_file in file_paths:
-            with open(out_file, "rb") as out_fp:
-                basename = os.path.basename(out_file)
-                filepath = os.path.join(directory_name, basename)
-                (content_type, content_encoding) = mimetypes.guess_type(out_file)
-                content_settings = ContentSettings(content_type, content_encoding)
-                if not self.blob_result_cc.exists():
-                    self.blob_result_cc.create_container()
-                self.blob_result_cc.upload_blob(
-                    filepath,
-                    data=out_fp,
-                    overwrite=True,
-                    content_settings=content_settings,
-                )
-            logging.info("uploaded file: %s", out_file)
+    @property
+    def locations(self) -> LocationInfo:
+        return self.context.locations
+
+    def upload_files(
+        self,
+        directory_name: str,
+        file_paths: list[str],
+        concurrency: int = UPLOAD_CONCURRENCY,
+    ):
+        if not self.blob_result_cc.exists():
+            self.blob_result_cc.create_container()
+
+        upload = partial(self.upload_file, directory_name)
+        if concurrency <= 1 or len(file_paths) <= 1:
+            for out_file in file_paths:
+                upload(out_file)
+            return
+        with ThreadPoolExecutor(min(concurrency, len(file_paths))) as executor:
+            # consumed so that the first failed upload is raised
+            list(executor.map(upload, file_paths))
+
+    def upload_file(self, directory_name: str, out_file: str):
+        with open(out_file, "rb") as out_fp:
+            basename = os.path.basename(out_file)
+            filepath = os.path.join(directory_name, basename)
+            (content_type, content_encoding) = mimetypes.guess_type(out_file)
+            content_settings = ContentSettings(content_type, content_encoding)
+            self.blob_result_cc.upload_blob(
+                filepath,
+                data=out_fp,
+                overwrite=True,
+                content_settings=content_settings,
+                max_concurrency=UPLOAD_BLOB_CONCURRENCY,
+            )
+        logging.info("uploaded file: %s", out_file)
+
+    def scratch_directory(self, name: str):
+        """Scratch directory of an invocation, removed when the `with` block exits."""
+        return scratch_space.directory(f"{name}-{self.dataset_id}")
 
-    def download_src_blob(self) -> str:
+    def download_src_blob(self, directory: str) -> str:
+        """Downloads the input blob into `directory`, usually a scratch directory."""
         blob_client = self.blob_input_cc.get_blob_client(self.blob_name)
-        tmp_fp = NamedTemporaryFile(suffix=".csv", delete=False)
+        input_filepath = os.path.join(directory, os.path.basename(self.blob_name))
 
-        if not blob_client.exists():
+        try:
+            blob_cache.fetch(blob_client, input_filepath)
+        except ResourceNotFoundError:
             logging.error("No blobs in the queue to process...")
             return ""
 
-        # download blob and save
-        with tmp_fp as downloaded_file:
-            downloaded_file.write(blob_client.download_blob().readall())
-
-        return os.path.realpath(tmp_fp.name)
+        return os.path.realpath(input_filepath)
 
     def update_dataset(self, extra_data: dict):
         update_operation = {"$set": extra_data}
         self.dataset_collection.update_one(
             {"_id": ObjectId(self.dataset_id)}, update_operation
         )
+        self.context.invalidate()
 
     def get_user(self):
-        dataset = self.get_dataset()
-        user_id = dataset["user"]
-        user_collection = self.db.get_collection("users")
-        return user_collection.find_one({"_id": user_id})
+        return self.context.user
 
     def is_all_analysis_complete(self) -> bool:
+        # the other analysis writes its status concurrently, so always re-read
+        self.context.invalidate()
         dataset = self.get_dataset()
         return all(
             [
@@ -131,7 +207,7 @@ class AnalysisUtils:
         )
 
     def get_dataset(self):
-        return self.dataset_collection.find_one({"_id": ObjectId(self.dataset_id)})
+        return self.context.dataset
 
     def send_analysis_confirmation_email(self):
         user = self.get_user()
@@ -165,7 +241,12 @@ class AnalysisUtils:
             },
         )
 
-    def postprocess(self):
+    def postprocess(self, case_risks: dict[str, list[float]] | None = None):
+        """`case_risks` are the ANN scenario risks returned by the ANN activity;
+        without them the archived case files are downloaded instead.
+
+        Returns the scenario risks used when the analysis completed, else None.
+        """
         dataset = self.get_dataset()
         completion_status = "failed"
         ann_passed = False
@@ -180,35 +261,42 @@ class AnalysisUtils:
 
         if ann_passed and eo_passed:
             completion_status = "complete"
-            case_blobpaths = []
-            for case in ["worst", "average"]:
-                for timing in ["am", "pm"]:
-                    case_blobpaths.append(
-                        f"{self.dataset_id}/{self.dataset_id}_{case}_case_{timing}.csv"
-                    )
-            case_filepaths = []
-            for case_blob in case_blobpaths:
-                fp = NamedTemporaryFile(suffix=".csv", delete=False)
-                fp.write(
-                    self.blob_result_cc.get_blob_client(case_blob)
-                    .download_blob()
-                    .readall()
+            with self.scratch_directory("postprocess") as tmpdir, ThreadPoolExecutor(
+                len(CASES) + 1
+            ) as executor:
+                input_filepath = os.path.join(tmpdir, os.path.basename(self.blob_name))
+                input_download = executor.submit(
+                    blob_cache.fetch,
+                    self.blob_input_cc.get_blob_client(self.blob_name),
+                    input_filepath,
                 )
-                fp.flush()
-                case_filepaths.append(fp.name)
-
-            input_filepath = self.download_src_blob()
+                if not case_risks or any(case not in case_risks for case in CASES):
+                    case_blob_names = [
+                        f"{self.dataset_id}/{self.dataset_id}_{case}.csv"
+                        for case in CASES
+                    ]
+                    case_files = executor.map(
+                        blob_cache.fetch,
+                        map(self.blob_result_cc.get_blob_client, case_blob_names),
+                        [
+                            os.path.join(tmpdir, os.path.basename(blob_name))
+                            for blob_name in case_blob_names
+                        ],
+                    )
+                    case_risks = dict(zip(CASES, read_case_risks(case_files)))
+                input_download.result()
 
-            water_safety = get_water_safety(
-                frc_target=frc_target,
-                case_filepaths=case_filepaths,
-                input_file=input_filepath,
-            )
+                water_safety = get_water_safety(
+                    frc_target=frc_target,
+                    case_risks=[case_risks[case] for case in CASES],
+                    input_file=input_filepath,
+                )
 
         self.update_dataset(
             {
                 "safety_range": water_safety.get("safety_range"),
                 "safe_percent": water_safety.get("safe_percent"),
+                "safety_curve": water_safety.get("safety_curve"),
                 "completionStatus": completion_status,
             }
         )
@@ -217,6 +305,8 @@ class AnalysisUtils:
         )
         self.send_analysis_confirmation_email()
 
+        return case_risks if completion_status == "complete" else None
+
     def get_error_message(self, message: str, analysis_method: AnalysisMethod):
         web_url = os.getenv("WEBURL")
         country_name = self.locations["country"]
@@ -294,11 +384,51 @@ class LocationInfo(TypedDict):
 def get_locations_from_fieldsite_id(
     fieldsite_id: ObjectId, db: Database[Dict[str, Any]]
 ) -> LocationInfo:
-    fieldsite_object = db.get_collection("fieldsites").find_one({"_id": fieldsite_id})
-    fieldsite_name = fieldsite_object["name"]
-    area_object = db.get_collection("areas").find_one({"fieldsites": fieldsite_id})
-    area_id = area_object["_id"]
-    area_name = area_object["name"]
-    country_object = db.get_collection("countries").find_one({"areas": area_id})
-    country_name = country_object["name"]
-    return {"country": country_name, "area": area_name, "fieldsite": fieldsite_name}
+    locations = location_cache.get(fieldsite_id)
+    if locations is None:
+        locations = find_locations(fieldsite_id, db)
+        location_cache.put(fieldsite_id, locations)
+    return locations
+
+
+def find_locations(
+    fieldsite_id: ObjectId, db: Database[Dict[str, Any]]
+) -> LocationInfo:
+    """Resolves fieldsite, area and country names in a single aggregation."""
+    pipeline = [
+        {"$match": {"_id": fieldsite_id}},
+        {"$limit": 1},
+        {
+            "$lookup": {
+                "from": "areas",
+                "localField": "_id",
+                "foreignField": "fieldsites",
+                "as": "areas",
+            }
+        },
+        {"$project": {"name": 1, "area": {"$arrayElemAt": ["$areas", 0]}}},
+        {
+            "$lookup": {
+                "from": "countries",
+                "localField": "area._id",
+                "foreignField": "areas",
+                "as": "countries",
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "fieldsite": "$name",
+                "area": "$area.name",
+                "country": {"$arrayElemAt": ["$countries.name", 0]},
+            }
+        },
+    ]
+    result = next(db.get_collection("fieldsites").aggregate(pipeline), None)
+    if not result or any(key not in result for key in LocationInfo.__annotations__):
+        raise LookupError(f"could not resolve locations of fieldsite {fieldsite_id}")
+    return {
+        "country": result["country"],
+        "area": result["area"],
+        "fieldsite": result["fieldsite"],
+    }
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import posixpath
+import zipfile
+from typing import BinaryIO, Iterator
+from xml.etree.ElementTree import fromstring, iterparse
+
+import openpyxl
+from openpyxl.cell.text import Text
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import (
+    CALENDAR_MAC_1904,
+    WINDOWS_EPOCH,
+    from_excel,
+    from_ISO8601,
+)
+
+from .standardize import RowSource
+
+SHEET_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+DIMENSION_TAG = f"{{{SHEET_MAIN_NS}}}dimension"
+SHEET_DATA_TAG = f"{{{SHEET_MAIN_NS}}}sheetData"
+ROW_TAG = f"{{{SHEET_MAIN_NS}}}row"
+VALUE_TAG = f"{{{SHEET_MAIN_NS}}}v"
+INLINE_STRING_TAG = f"{{{SHEET_MAIN_NS}}}is"
+STYLES_PATH = "xl/styles.xml"
+
+
+class SheetRowSource(RowSource):
+    """Rows of a sheet read from `sheet_rows`, an iterator of cell value tuples."""
+
+    sheet_rows: Iterator[tuple]
+
+    def header(self) -> list[str]:
+        first_row = next(self.sheet_rows, ())
+        return ["" if value is None else str(value) for value in first_row]
+
+    def rows(self, n_columns: int) -> Iterator[tuple[int, list]]:
+        for row_number, row in enumerate(self.sheet_rows, 2):
+            if all(value is None or value == "" for value in row):
+                continue
+            cells = list(row)
+            cells.extend([None] * (n_columns - len(cells)))
+            yield row_number, cells
+
+
+class XLSXRowSource(SheetRowSource):
+    """Rows of the active sheet of a workbook, with typed cell values."""
+
+    def __init__(self, fp: BinaryIO):
+        self.workbook = openpyxl.load_workbook(fp, read_only=True, data_only=True)
+        self.sheet_rows = self.workbook.active.iter_rows(values_only=True)
+
+    def close(self):
+        self.workbook.close()
+
+
+def cast_number(value: str) -> int | float:
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def read_relationships(archive: zipfile.ZipFile, part_path: str) -> dict[str, tuple]:
+    """Maps relationship ids of a package part to (type, absolute target path)."""
+    part_dir, part_name = posixpath.split(part_path)
+    rels_path = posixpath.join(part_dir, "_rels", f"{part_name}.rels")
+    relationships = {}
+    for rel in fromstring(archive.read(rels_path)).iter(
+        f"{{{PKG_REL_NS}}}Relationship"
+    ):
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(part_dir, target))
+        relationships[rel.get("Id")] = (rel.get("Type", ""), target)
+    return relationships
+
+
+class StreamingXLSXRowSource(SheetRowSource):
+    """Reads the active sheet straight out of the zip with incremental parsing.
+
+    Yields the same rows as `XLSXRowSource` (openpyxl in read-only, data-only
+    mode), including its date conversion and its use of the sheet dimension,
+    without building a cell object per value.
+    """
+
+    def __init__(self, fp: BinaryIO):
+        self.archive = zipfile.ZipFile(fp)
+        (_, workbook_path) = next(
+            rel
+            for rel in read_relationships(self.archive, "").values()
+            if rel[0].endswith("/officeDocument")
+        )
+        workbook_relationships = read_relationships(self.archive, workbook_path)
+        workbook = fromstring(self.archive.read(workbook_path))
+
+        properties = workbook.find(f"{{{SHEET_MAIN_NS}}}workbookPr")
+        self.epoch = WINDOWS_EPOCH
+        if properties is not None and properties.get("date1904") in ("1", "true"):
+            self.epoch = CALENDAR_MAC_1904
+
+        active_tab = 0
+        for view in workbook.iter(f"{{{SHEET_MAIN_NS}}}workbookView"):
+            if view.get("activeTab") is not None:
+                active_tab = int(view.get("activeTab"))
+                break
+        sheets = list(workbook.iter(f"{{{SHEET_MAIN_NS}}}sheet"))
+        (_, sheet_path) = workbook_relationships[
+            sheets[active_tab].get(f"{{{REL_NS}}}id")
+        ]
+
+        # resolved once for the whole sheet
+        self.shared_strings = []
+        for rel_type, target in workbook_relationships.values():
+            if rel_type.endswith("/sharedStrings"):
+                with self.archive.open(target) as src:
+                    self.shared_strings = read_string_table(src)
+
+        self.date_formats = set()
+        self.timedelta_formats = set()
+        if STYLES_PATH in self.archive.namelist():
+            stylesheet = Stylesheet.from_tree(
+                fromstring(self.archive.read(STYLES_PATH))
+            )
+            self.date_formats = stylesheet.date_formats
+            self.timedelta_formats = stylesheet.timedelta_formats
+
+        self.column_indices: dict[str, int] = {}
+        self.sheet_rows = self.iter_sheet_rows(sheet_path)
+
+    def column_index(self, coordinate: str) -> int:
+        letters = coordinate.rstrip("0123456789")
+        index = self.column_indices.get(letters)
+        if index is None:
+            index = self.column_indices[letters] = column_index_from_string(letters)
+        return index
+
+    def cell_value(self, cell, data_type: str):
+        if data_type == "inlineStr":
+            child = cell.find(INLINE_STRING_TAG)
+            return None if child is None else Text.from_tree(child).content
+
+        value = cell.findtext(VALUE_TAG) or None
+        if value is None:
+            return None
+        if data_type == "n":
+            value = cast_number(value)
+            style_id = int(cell.get("s") or 0)
+            if style_id in self.date_formats:
+                try:
+                    return from_excel(
+                        value,
+                        self.epoch,
+                        timedelta=style_id in self.timedelta_formats,
+                    )
+                except (OverflowError, ValueError):
+                    return "#VALUE!"
+            return value
+        if data_type == "s":
+            return self.shared_strings[int(value)]
+        if data_type == "b":
+            return bool(int(value))
+        if data_type == "d":
+            return from_ISO8601(value)
+        return value
+
+    def read_dimension(self, sheet_path: str) -> tuple:
+        with self.archive.open(sheet_path) as src:
+            for _, element in iterparse(src, events=("start",)):
+                if element.tag == DIMENSION_TAG:
+                    return range_boundaries(element.get("ref"))
+                if element.tag == SHEET_DATA_TAG:
+                    break
+        return (None, None, None, None)
+
+    def iter_parsed_rows(self, sheet_path: str) -> Iterator[tuple[int, list]]:
+        row_number = 0
+        sheet_data = None
+        with self.archive.open(sheet_path) as src:
+            for event, element in iterparse(src, events=("start", "end")):
+                if event == "start":
+                    if element.tag == SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if element.tag != ROW_TAG:
+                    continue
+
+                row_number = int(float(element.get("r") or row_number + 1))
+                column = 0
+                cells = []
+                for cell in element:
+                    coordinate = cell.get("r")
+                    column = self.column_index(coordinate) if coordinate else column + 1
+                    cells.append((column, self.cell_value(cell, cell.get("t", "n"))))
+                # drop the parsed row so the tree does not grow with the sheet
+                element.clear()
+                if sheet_data is not None:
+                    sheet_data.remove(element)
+                yield row_number, cells
+
+    def iter_sheet_rows(self, sheet_path: str) -> Iterator[tuple]:
+        # mirrors openpyxl's ReadOnlyWorksheet._cells_by_row with values_only=True
+        (_, _, max_col, max_row) = self.read_dimension(sheet_path)
+        empty_row = () if max_col is None else (None,) * max_col
+
+        counter = 1
+        row_number = 1
+        for row_number, cells in self.iter_parsed_rows(sheet_path):
+            if max_row is not None and row_number > max_row:
+                break
+            for _ in range(counter, row_number):
+                counter += 1
+                yield empty_row
+            if counter <= row_number:
+                counter += 1
+                if not cells and not max_col:
+                    yield ()
+                    continue
+                width = max_col or cells[-1][0]
+                values = [None] * width
+                for column, value in cells:
+                    if column <= width:
+                        values[column - 1] = value
+                yield tuple(values)
+
+        if max_row is not None and max_row < row_number:
+            for _ in range(counter, max_row + 1):
+                yield empty_row
+
+    def close(self):
+        self.archive.close()